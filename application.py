@@ -1,27 +1,243 @@
+import concurrent.futures
+import contextlib
+import contextvars
 import importlib
 import logging
-
-from web3.exceptions import ContractLogicError
-
+import os
+import threading
+from collections import defaultdict
+
+from breaker import (ENVIRONMENT_BREAKER_FAILURE_THRESHOLD_KEY, ENVIRONMENT_BREAKER_MAX_RESET_TIMEOUT_KEY,
+                     ENVIRONMENT_BREAKER_RESET_TIMEOUT_KEY, CircuitOpenError, get_breaker_registry)
+from config import get_config_file
+from coordination import LeaseManagerInterface
+from gas import ENVIRONMENT_GAS_CACHE_FILE_KEY, ENVIRONMENT_GAS_LIMIT_MARGIN_KEY
 from node import NodeInterface
 from notification import NotifierInterface
-from utility import get_private_key_map
+from preflight import ACTION_CLAIM, simulate_transactions
+from ratelimit import (ENVIRONMENT_RPC_BURST_KEY, ENVIRONMENT_RPC_LATENCY_TARGET_KEY,
+                       ENVIRONMENT_RPC_MAX_CONCURRENCY_KEY, ENVIRONMENT_RPC_RATE_LIMIT_KEY)
+from tracing import profile_thread, span
+from utility import (ENVIRONMENT_ENCRYPTION_SECRET, ENVIRONMENT_PRIVATE_KEY_MAP_KEY, ENVIRONMENT_RPC_ENDPOINT_KEY,
+                     get_private_key_map, get_rpc_endpoint)
 
 log = logging.getLogger(__name__)
 
+ENVIRONMENT_NODE_PLUGINS_KEY = 'NODE_PLUGINS'
+ENVIRONMENT_LEASE_BACKEND_KEY = 'LEASE_BACKEND'
+ENVIRONMENT_LEASE_DURATION_KEY = 'LEASE_DURATION'
+ENVIRONMENT_REPLICA_ID_KEY = 'REPLICA_ID'
+ENVIRONMENT_NOTIFIER_KEY = 'NOTIFIER'
+ENVIRONMENT_COMPOUND_PCT_KEY = 'COMPOUND_PCT'
+
+# settings read once when their component is created, changing them on reload needs a restart
+RESTART_REQUIRED_KEYS = {
+    ENVIRONMENT_LEASE_BACKEND_KEY, ENVIRONMENT_LEASE_DURATION_KEY, ENVIRONMENT_REPLICA_ID_KEY,
+    ENVIRONMENT_RPC_RATE_LIMIT_KEY, ENVIRONMENT_RPC_BURST_KEY, ENVIRONMENT_RPC_MAX_CONCURRENCY_KEY,
+    ENVIRONMENT_RPC_LATENCY_TARGET_KEY,
+    ENVIRONMENT_GAS_CACHE_FILE_KEY, ENVIRONMENT_GAS_LIMIT_MARGIN_KEY,
+    ENVIRONMENT_BREAKER_FAILURE_THRESHOLD_KEY, ENVIRONMENT_BREAKER_RESET_TIMEOUT_KEY,
+    ENVIRONMENT_BREAKER_MAX_RESET_TIMEOUT_KEY,
+}
+
+
+def parse_plugin_list(plugins_str: str):
+    """
+        Node plugins are configured as a comma separated list of module.Class paths
+        e.g. node.power.PowerNode,node.other.OtherNode
+    :param plugins_str:
+    :return: list of (module, class) pairs
+    """
+    plugins = []
+    for plugin_path in plugins_str.split(','):
+        plugin_path = plugin_path.strip()
+        if plugin_path:
+            module_str, _, class_name = plugin_path.rpartition('.')
+            plugins.append((module_str, class_name))
+    return plugins
+
 
 class Exponentiator:
 
     def __init__(self, node_module_str='node.power', node_class='PowerNode', notifier_module_str='notification.smtp',
-                 notifier_class='EmailHandler'):
+                 notifier_class='EmailHandler', node_plugins=None, lease_backend=None):
+
+        # settings of the config file override the environment, it is loaded first so they apply from the start
+        self.config_file = get_config_file()
+
+        self.default_node_plugins = [(node_module_str, node_class)]
+        # plugins passed in explicitly are not reconfigured on reload
+        self._node_plugins_fixed = node_plugins is not None
+        self.node_plugins = node_plugins if self._node_plugins_fixed else self.__get_node_plugins()
+        # e.g. coordination.sqlite.SqliteLeaseManager, without a backend this instance processes every wallet
+        self.lease_backend = lease_backend or os.getenv(ENVIRONMENT_LEASE_BACKEND_KEY)
+        self.default_notifier = (notifier_module_str, notifier_class)
+        self.notifier_module_str, self.notifier_class = self.__get_notifier_plugin()
+
+        self._notifier = None
+        self._node_managers = None
+        self._lease_manager = None
+        self._plugin_lock = threading.Lock()
+
+        # protocols run concurrently but transactions of one wallet must not race for the same nonce
+        self._wallet_locks = defaultdict(threading.Lock)
+
+        # portfolio read by the last check of every node plugin and the wallets it may have changed since
+        self._portfolio_snapshots = {}
+
+    @property
+    def notifier(self) -> NotifierInterface:
+        """
+            The notifier plugin is only imported and created the first time it is needed
+        :return:
+        """
+        if not self._notifier:
+            notifier_module = importlib.import_module(self.notifier_module_str)
+            self._notifier = getattr(notifier_module, self.notifier_class)()
+            self._notifier.setup()
+        return self._notifier
+
+    @property
+    def node_managers(self) -> dict:
+        """
+            The node plugins pull in web3 and friends so they are only imported and created on first use.
+            All of them share the notifier, the network connection and the decrypted keys.
+        :return: dict of plugin name to node manager
+        """
+        with self._plugin_lock:
+            if self._node_managers is None:
+                self._node_managers = self.__create_node_managers()
+        return self._node_managers
+
+    def __create_node_managers(self, existing_node_managers=None):
+        """
+            Creates the configured node plugins, those already running are kept along with their state
+        :param existing_node_managers:
+        :return:
+        """
+        existing_node_managers = existing_node_managers or {}
+        node_managers = {}
+        for node_module_str, node_class in self.node_plugins:
+            if node_class in existing_node_managers:
+                node_managers[node_class] = existing_node_managers[node_class]
+                continue
+            node_module = importlib.import_module(node_module_str)
+            node_managers[node_class] = getattr(node_module, node_class)(notifier=self.notifier)
+        return node_managers
+
+    def __get_node_plugins(self):
+        node_plugins_str = os.getenv(ENVIRONMENT_NODE_PLUGINS_KEY)
+        return parse_plugin_list(node_plugins_str) if node_plugins_str else self.default_node_plugins
+
+    def __get_notifier_plugin(self):
+        notifier_str = os.getenv(ENVIRONMENT_NOTIFIER_KEY)
+        return parse_plugin_list(notifier_str)[0] if notifier_str else self.default_notifier
+
+    @property
+    def lease_manager(self) -> LeaseManagerInterface:
+        """
+            The lease backend shared with the other replicas, None when running as a single instance
+        :return:
+        """
+        if self.lease_backend and not self._lease_manager:
+            lease_module_str, lease_class = parse_plugin_list(self.lease_backend)[0]
+            lease_module = importlib.import_module(lease_module_str)
+            self._lease_manager = getattr(lease_module, lease_class)(
+                replica_id=os.getenv(ENVIRONMENT_REPLICA_ID_KEY),
+                lease_duration=float(os.getenv(ENVIRONMENT_LEASE_DURATION_KEY, 900)))
+            self._lease_manager.setup()
+        return self._lease_manager
+
+    def get_accounts_map(self):
+        """
+            The accounts this instance is responsible for, when replicas share the fleet
+            only the wallets whose lease this replica holds.
+        :return:
+        """
+        accounts_map = get_private_key_map()
+        if not self.lease_manager:
+            return accounts_map
 
-        logging.basicConfig(level=logging.INFO)
+        held_wallets = set(self.lease_manager.claim(sorted(account.address for account in accounts_map.values())))
+        log.info(" get_accounts_map -- replica [%s] holds %s of %s wallets",
+                 self.lease_manager.replica_id, len(held_wallets), len(accounts_map))
+        return {wallet_name: account for wallet_name, account in accounts_map.items()
+                if account.address in held_wallets}
 
-        notifier_module = importlib.import_module(notifier_module_str)
-        self.notifier: NotifierInterface = getattr(notifier_module, notifier_class)()
+    def reload_config(self):
+        """
+            Re-reads the config file and applies only the settings that changed. Decrypted keys, connections,
+            caches, breakers and leases are kept so the running fleet does not warm up again.
+        :return: the names of the settings that changed
+        """
+        if not self.config_file:
+            log.warning(" reload_config -- there is no config file to reload, set it with CONFIG_FILE")
+            return set()
+
+        try:
+            changed_keys = self.config_file.load()
+        except (OSError, ValueError):
+            log.error(" reload_config -- keeping the current settings, unable to read %s ", self.config_file.path,
+                      exc_info=True)
+            return set()
+
+        if not changed_keys:
+            log.info(" reload_config -- %s has no changes", self.config_file.path)
+            return changed_keys
+        log.info(" reload_config -- applying changes to %s", ', '.join(sorted(changed_keys)))
+
+        if changed_keys & {ENVIRONMENT_PRIVATE_KEY_MAP_KEY, ENVIRONMENT_ENCRYPTION_SECRET}:
+            # only the keys of wallets not seen before are decrypted
+            log.info(" reload_config -- %s wallets configured", len(get_private_key_map()))
+
+        if ENVIRONMENT_NODE_PLUGINS_KEY in changed_keys and not self._node_plugins_fixed:
+            self.node_plugins = self.__get_node_plugins()
+            with self._plugin_lock:
+                if self._node_managers is not None:
+                    self._node_managers = self.__create_node_managers(self._node_managers)
+
+        if ENVIRONMENT_NOTIFIER_KEY in changed_keys:
+            self.__reload_notifier()
+        elif self._notifier:
+            # notifiers read their settings e.g. the smtp server on setup
+            self._notifier.setup()
+
+        if ENVIRONMENT_RPC_ENDPOINT_KEY in changed_keys:
+            log.info(" reload_config -- switching to %s from the next cycle", get_rpc_endpoint())
+
+        restart_keys = changed_keys & RESTART_REQUIRED_KEYS
+        if restart_keys:
+            log.warning(" reload_config -- %s only apply after a restart", ', '.join(sorted(restart_keys)))
+
+        return changed_keys
+
+    def __reload_notifier(self):
+        self.notifier_module_str, self.notifier_class = self.__get_notifier_plugin()
+        if not self._notifier:
+            return
+
+        self._notifier = None
+        notifier = self.notifier
+        for node_manager in (self._node_managers or {}).values():
+            node_manager.notifier = notifier
+            if getattr(node_manager, 'dex', None):
+                node_manager.dex.notifier = notifier
+
+    def clean_up(self):
+        """
+            Releases the wallet leases so other replicas take over without waiting for them to expire
+        :return:
+        """
+        if self._lease_manager:
+            self._lease_manager.release()
 
-        node_module = importlib.import_module(node_module_str)
-        self.node_manager: NodeInterface = getattr(node_module, node_class)(notifier=self.notifier)
+    @property
+    def node_manager(self) -> NodeInterface:
+        """
+            The first configured node plugin
+        :return:
+        """
+        return next(iter(self.node_managers.values()))
 
     def notify_compounding_opportunity(self, investment):
 
@@ -76,109 +292,353 @@ class Exponentiator:
 
         self.notifier.send(subject=email_subject, content=email_body)
 
-    def __get_investment_map(self, wallet_name, wallet_address):
+    def __fan_out(self, action_name, action, **kwargs):
+        """
+            Runs an action for every node plugin concurrently and merges their results.
+            A failing protocol does not stop the others, only when all of them fail is the error raised.
 
-        wallet_balance = self.node_manager.get_wallet_balance(wallet_address)
-        node_count = self.node_manager.get_node_count(wallet_address)
-        rewards_total = self.node_manager.get_account_rewards_balance(wallet_address)
+        :param action_name:
+        :param action:
+        :param kwargs:
+        :return:
+        """
+        node_managers = self.node_managers
+        if len(node_managers) == 1:
+            # a single protocol runs on the calling thread, no pool to pay for and profiles see all of it
+            plugin_name, node_manager = next(iter(node_managers.items()))
+            try:
+                return action(node_manager, **kwargs)
+            except Exception:
+                log.error(" %s -- protocol [%s] failed ", action_name, plugin_name, exc_info=True)
+                raise
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(node_managers),
+                                                   thread_name_prefix=action_name) as executor:
+            futures = {
+                plugin_name: executor.submit(contextvars.copy_context().run, self.__run_protocol, action,
+                                             node_manager, **kwargs)
+                for plugin_name, node_manager in node_managers.items()}
+
+        results = {}
+        errors = {}
+        for plugin_name, future in futures.items():
+            try:
+                results[plugin_name] = future.result()
+            except Exception as e:
+                log.error(" %s -- protocol [%s] failed ", action_name, plugin_name, exc_info=True)
+                errors[plugin_name] = e
 
-        investment = {
-            'name': wallet_name,
-            'address': wallet_address,
-            'balance': wallet_balance,
-            'node_count': node_count,
-            'rewards': rewards_total}
+        if errors and not results:
+            raise next(iter(errors.values()))
 
-        log.info(" __get_investment_map -- Account [%s] has %s nodes and %s rewards",
-                 wallet_name, node_count, rewards_total)
+        merged_results = [f'{plugin_name}: {result}' for plugin_name, result in results.items()]
+        merged_results += [f'{plugin_name}: Failed with {error}' for plugin_name, error in errors.items()]
+        return ', '.join(merged_results)
 
-        return investment
+    @staticmethod
+    def __run_protocol(action, node_manager: NodeInterface, **kwargs):
+        with profile_thread():
+            return action(node_manager, **kwargs)
 
     def execute_check(self, compound_pct=100):
 
         """
             Glue method to get all investments given a list of wallets and
-            excecutes logic to trigger further actions.
+            excecutes logic to trigger further actions for every node protocol.
             Set conditions.
         :return:
         """
 
         log.debug(" execute_check -- initiating checks for investments in ")
 
-        self.node_manager.setup()
+        accounts_map = self.get_accounts_map()
 
-        accounts_map = get_private_key_map()
+        return self.__fan_out('execute_check', self.__execute_node_check,
+                              accounts_map=accounts_map, compound_pct=compound_pct)
 
-        for wallet_name, account in accounts_map.items():
-            wallet_address = account.address
+    def __execute_node_check(self, node_manager: NodeInterface, accounts_map: dict, compound_pct=100):
+
+        from web3.exceptions import ContractLogicError
+
+        node_manager.setup()
+
+        accounts_map = self.__get_available_accounts(node_manager, accounts_map)
+        portfolio = node_manager.get_portfolio(
+            {wallet_name: account.address for wallet_name, account in accounts_map.items()})
+        # wallets without nodes are left out of the portfolio too, only failed reads count against the breaker
+        for wallet_name, read_error in portfolio.read_errors.items():
+            self.__get_wallet_breaker(node_manager, accounts_map[wallet_name].address).record_failure(read_error)
+
+        can_compound_list = node_manager.can_compound_many(portfolio, compound_pct=compound_pct)
+        self._portfolio_snapshots[node_manager] = (
+            portfolio, {wallet.address for wallet, can_compound in zip(portfolio, can_compound_list) if can_compound})
+
+        compounding_plans = []
+        for wallet, can_compound in zip(portfolio, can_compound_list):
+            wallet_name = wallet.name
+            wallet_breaker = self.__get_wallet_breaker(node_manager, wallet.address)
             try:
+                with span('wallet', **{'wallet.name': wallet_name}):
+                    investment = wallet.to_investment()
+
+                    log.info(" execute_check -- Account [%s] has %s nodes and %s rewards",
+                             wallet_name, investment['node_count'], investment['rewards'])
 
-                investment = self.__get_investment_map(
-                    wallet_name=wallet_name,
-                    wallet_address=wallet_address
-                )
+                    if can_compound:
+                        compounding_name = node_manager.get_compounding_name(
+                            wallet_address=investment['address'])
 
-                if self.node_manager.can_compound(investment, compound_pct=compound_pct):
-                    compounding_name = self.node_manager.get_compounding_name(
-                        wallet_address=investment['address'])
+                        log.info(
+                            "Sufficient rewards to compound for [%s] at bal: %s and rewards: %s ",
+                            investment['name'], investment['balance'], investment['rewards'])
 
-                    log.info(
-                        "Sufficient rewards to compound for [%s] at bal: %s and rewards: %s ",
-                        investment['name'], investment['balance'], investment['rewards'])
+                        planned_transactions = node_manager.plan_transactions(
+                            account=accounts_map[wallet_name], compounding_name=compounding_name,
+                            investment=investment, compound_pct=compound_pct)
 
-                    try:
-                        if not self.node_manager.compound(account=accounts_map[investment['name']],
-                                                          compounding_name=compounding_name):
-                            self.notify_compounding_opportunity(investment=investment)
+                        if planned_transactions is None:
+                            if self.__confirm_leases([wallet.address]):
+                                self.__record_outcome(wallet_breaker, self.__compound(
+                                    node_manager, accounts_map[wallet_name], compounding_name, investment,
+                                    compound_pct=compound_pct))
                         else:
-                            self.node_manager.claim_rewards(account=accounts_map[investment['name']],
-                                                            compound_pct=compound_pct)
-                    except Exception as e:
-                        self.notify_compounding_error(investment=investment, error=str(e))
+                            compounding_plans.append((investment, planned_transactions))
 
-                else:
+                    else:
 
-                    log.info(
-                        "Can not yet compound for [%s] at bal: %s and rewards: %s ",
-                        investment['name'], investment['balance'], investment['rewards'])
+                        log.info(
+                            "Can not yet compound for [%s] at bal: %s and rewards: %s ",
+                            investment['name'], investment['balance'], investment['rewards'])
+                        wallet_breaker.record_success()
 
+            except CircuitOpenError:
+                raise
             except ContractLogicError as e:
                 if 'NO NODE OWNER' in str(e):
+                    # a wallet without nodes is reachable, only real read or transaction errors open its breaker
+                    wallet_breaker.record_success()
                     log.info("Account [%s] had no nodes attached", wallet_name)
                 else:
+                    wallet_breaker.record_failure(e)
                     log.warning(" Account [%s] experienced a contract error ", wallet_name, exc_info=True)
+            except Exception as e:
+                wallet_breaker.record_failure(e)
+                log.warning(" Account [%s] experienced an error ", wallet_name, exc_info=True)
+
+        if compounding_plans:
+            simulate_transactions([planned_transaction for _, planned_transactions in compounding_plans
+                                   for planned_transaction in planned_transactions])
+
+        for investment, planned_transactions in compounding_plans:
+            if not self.__confirm_leases([investment['address']]):
+                continue
+            with span('wallet', **{'wallet.name': investment['name']}):
+                self.__record_outcome(self.__get_wallet_breaker(node_manager, investment['address']),
+                                      self.__submit_compounding_plan(investment, planned_transactions))
 
         return "Succeeded in executing check"
 
-    def execute_withdraw(self, compound_pct=100, interval_in_hours=24):
+    def __confirm_leases(self, wallet_addresses: list):
+        """
+            Renews the leases of the wallets right before their transactions are sent. A cycle or backoff
+            outlasting the lease duration could otherwise send for wallets another replica took over.
+        :param wallet_addresses:
+        :return: the wallet addresses this replica still holds
+        """
+        if not self.lease_manager:
+            return set(wallet_addresses)
 
-        accounts_map = get_private_key_map()
+        held_addresses = set(self.lease_manager.renew(sorted(wallet_addresses)))
+        for wallet_address in sorted(set(wallet_addresses) - held_addresses):
+            log.warning(" __confirm_leases -- lease of [%s] was lost, leaving it to the replica holding it",
+                        wallet_address)
+        return held_addresses
 
+    @staticmethod
+    def __get_wallet_breaker(node_manager: NodeInterface, wallet_address: str):
+        return get_breaker_registry().get(f'wallet:{type(node_manager).__name__}:{wallet_address}')
+
+    def __get_available_accounts(self, node_manager: NodeInterface, accounts_map: dict):
+        """
+            Leaves out the wallets whose breaker is open, they back off on their own
+            while the rest of the fleet keeps its cadence.
+        :param node_manager:
+        :param accounts_map:
+        :return:
+        """
+        available_accounts = {}
         for wallet_name, account in accounts_map.items():
-            wallet_address = account.address
-            investment = self.__get_investment_map(
-                wallet_name=wallet_name,
-                wallet_address=wallet_address
-            )
+            if self.__get_wallet_breaker(node_manager, account.address).allow():
+                available_accounts[wallet_name] = account
+            else:
+                log.info(" __get_available_accounts -- skipping Account [%s] until its breaker closes", wallet_name)
+        return available_accounts
+
+    @staticmethod
+    def __record_outcome(wallet_breaker, error=None):
+        if error:
+            wallet_breaker.record_failure(error)
+        else:
+            wallet_breaker.record_success()
+
+    def __compound(self, node_manager: NodeInterface, account, compounding_name: str, investment: dict,
+                   compound_pct=100):
+        """
+            Compounds through a plugin that does not plan its transactions
+        :return: the error, None when successful
+        """
+        try:
+            with self._wallet_locks[account.address]:
+                if not node_manager.compound(account=account,
+                                             compounding_name=compounding_name,
+                                             investment=investment,
+                                             compound_pct=compound_pct):
+                    self.notify_compounding_opportunity(investment=investment)
+                else:
+                    node_manager.claim_rewards(account=account, compound_pct=compound_pct)
+        except Exception as e:
+            self.notify_compounding_error(investment=investment, error=str(e))
+            return str(e)
+        return None
+
+    def __submit_compounding_plan(self, investment: dict, planned_transactions: list):
+        """
+            Sends the transactions of a wallet that passed preflight. Reverting compounds are reported
+            instead of being broadcast and rewards are only claimed once something was compounded.
+        :param investment:
+        :param planned_transactions:
+        :return: the error, None when successful
+        """
+        planned_compounds = [planned_transaction for planned_transaction in planned_transactions
+                             if planned_transaction.action != ACTION_CLAIM]
+        planned_claims = [planned_transaction for planned_transaction in planned_transactions
+                          if planned_transaction.action == ACTION_CLAIM]
+
+        revert_reasons = [f'{planned_transaction.description} : {planned_transaction.revert_reason}'
+                          for planned_transaction in planned_transactions if planned_transaction.will_revert]
+        if revert_reasons:
+            log.info(" execute_check -- preflight dropped transactions of [%s] : %s",
+                     investment['name'], revert_reasons)
+
+        try:
+            with self._wallet_locks[investment['address']]:
+                compounding_done = False
+                for planned_compound in planned_compounds:
+                    if not planned_compound.will_revert:
+                        receipt = planned_compound.submit()
+                        log.info(" execute_check -- completed successful %s with receipt  %s",
+                                 planned_compound.description, receipt)
+                        compounding_done = True
+
+                if compounding_done:
+                    for planned_claim in planned_claims:
+                        if not planned_claim.will_revert:
+                            receipt = planned_claim.submit()
+                            log.info(" execute_check -- completed successful %s with receipt  %s",
+                                     planned_claim.description, receipt)
+        except Exception as e:
+            self.notify_compounding_error(investment=investment, error=str(e))
+            return str(e)
+
+        if revert_reasons and not compounding_done:
+            self.notify_compounding_error(investment=investment, error='\n'.join(revert_reasons))
+            return '\n'.join(revert_reasons)
+        elif not compounding_done:
+            self.notify_compounding_opportunity(investment=investment)
+        return None
+
+    def execute_withdraw(self, compound_pct=100, interval_in_hours=24):
+
+        accounts_map = self.get_accounts_map()
+
+        return self.__fan_out('execute_withdraw', self.__execute_node_withdraw, accounts_map=accounts_map,
+                              compound_pct=compound_pct, interval_in_hours=interval_in_hours)
+
+    def __get_withdrawal_portfolio(self, node_manager: NodeInterface, wallets: dict):
+        """
+            Reuses the portfolio the check just read, only wallets that compounded since are read again
+        :param node_manager:
+        :param wallets: dict of wallet name to wallet address
+        :return: list of wallet views
+        """
+        snapshot, changed_addresses = self._portfolio_snapshots.pop(node_manager, (None, set()))
+        if snapshot is None:
+            return list(node_manager.get_portfolio(wallets))
+
+        refreshed = node_manager.get_portfolio(
+            {wallet_name: wallet_address for wallet_name, wallet_address in wallets.items()
+             if wallet_address in changed_addresses})
+
+        wallet_views = []
+        for wallet_name, wallet_address in wallets.items():
+            wallet = refreshed.get(wallet_name) if wallet_address in changed_addresses else snapshot.get(wallet_name)
+            if wallet:
+                wallet_views.append(wallet)
+        return wallet_views
+
+    def __execute_node_withdraw(self, node_manager: NodeInterface, accounts_map: dict, compound_pct=100,
+                                interval_in_hours=24):
+
+        node_manager.setup()
+
+        accounts_map = self.__get_available_accounts(node_manager, accounts_map)
+        wallets = {wallet_name: account.address for wallet_name, account in accounts_map.items()}
+
+        investments = [wallet.to_investment() for wallet in self.__get_withdrawal_portfolio(node_manager, wallets)]
+        try:
+            generation_capacities = node_manager.get_generation_capacity_many(investments,
+                                                                              interval_in_hours=interval_in_hours)
+        except Exception as e:
+            generation_capacities = [e] * len(investments)
+
+        withdrawals = []
+        for investment, generation_capacity in zip(investments, generation_capacities):
+            if isinstance(generation_capacity, Exception):
+                log.warning(" execute_withdraw -- Account [%s] generation capacity could not be read %s",
+                            investment['name'], generation_capacity)
+                self.__record_outcome(self.__get_wallet_breaker(node_manager, investment['address']),
+                                      generation_capacity)
+                continue
 
-            generation_capacity = investment['node_count'] * self.node_manager.get_reward_per_hour() * interval_in_hours
             withdrawal_threshold = generation_capacity * (100 - compound_pct) / 100
             if 0 < withdrawal_threshold < investment['balance']:
                 log.info(
                     " execute_withdraw -- there is enough balance [%s] to swap over threshold : %s",
                     investment['balance'], withdrawal_threshold)
-
-                try:
-                    self.node_manager.get_dex().swap(account=account, amount_to_swap=1)
-                except Exception as e:
-                    self.notify_withdrawal_error(
-                        investment=investment,
-                        withdrawal_amount=withdrawal_threshold,
-                        error=str(e))
-                    return "Error withdrawing to native token"
+                withdrawals.append((investment, withdrawal_threshold))
             else:
                 log.info(
                     " execute_withdraw -- insufficient balance [%s] to swap over threshold : %s",
                     investment['balance'], withdrawal_threshold)
 
+        if withdrawals:
+            held_addresses = self.__confirm_leases([investment['address'] for investment, _ in withdrawals])
+            withdrawals = [withdrawal for withdrawal in withdrawals if withdrawal[0]['address'] in held_addresses]
+
+        if not withdrawals:
+            return "Succeeded in withdrawing"
+
+        with contextlib.ExitStack() as wallet_locks:
+            for wallet_address in sorted(investment['address'] for investment, _ in withdrawals):
+                wallet_locks.enter_context(self._wallet_locks[wallet_address])
+
+            try:
+                swap_results = node_manager.get_dex().swap_many(
+                    [(accounts_map[investment['name']], 1) for investment, _ in withdrawals])
+            except Exception as e:
+                swap_results = [e] * len(withdrawals)
+
+        withdrawal_errors = False
+        for (investment, withdrawal_threshold), swap_result in zip(withdrawals, swap_results):
+            self.__record_outcome(self.__get_wallet_breaker(node_manager, investment['address']),
+                                  swap_result if isinstance(swap_result, Exception) else None)
+            if isinstance(swap_result, Exception):
+                withdrawal_errors = True
+                self.notify_withdrawal_error(
+                    investment=investment,
+                    withdrawal_amount=withdrawal_threshold,
+                    error=str(swap_result))
+
+        if withdrawal_errors:
+            return "Error withdrawing to native token"
         return "Succeeded in withdrawing"
@@ -0,0 +1,194 @@
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_BREAKER_FAILURE_THRESHOLD_KEY = 'BREAKER_FAILURE_THRESHOLD'
+ENVIRONMENT_BREAKER_RESET_TIMEOUT_KEY = 'BREAKER_RESET_TIMEOUT'
+ENVIRONMENT_BREAKER_MAX_RESET_TIMEOUT_KEY = 'BREAKER_MAX_RESET_TIMEOUT'
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling something whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+        Tracks the failures of one wallet or endpoint.
+
+        After `failure_threshold` consecutive failures the breaker opens and calls are skipped until a
+        jittered reset timeout passes. Then it is half open and lets calls through again, success closes the
+        breaker while another failure opens it again with a doubled timeout, up to `max_reset_timeout`.
+        A half open breaker that sees no outcome stays half open, so skipping a call never strands it.
+    """
+
+    def __init__(self, name: str, failure_threshold=3, reset_timeout=60.0, max_reset_timeout=3600.0, clock=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+
+        self.opened = False
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.times_opened = 0
+        self.last_error = None
+        self.last_failure_time = None
+        self.retry_at = None
+        self._lock = threading.Lock()
+
+    def __get_state(self):
+        if not self.opened:
+            return STATE_CLOSED
+        return STATE_HALF_OPEN if self.clock() >= self.retry_at else STATE_OPEN
+
+    @property
+    def state(self):
+        with self._lock:
+            return self.__get_state()
+
+    def allow(self):
+        """
+            Whether a call may go ahead, which is the case unless the breaker is open.
+            Only recorded outcomes change the state of the breaker.
+        :return:
+        """
+        with self._lock:
+            return self.__get_state() != STATE_OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            if self.opened:
+                log.info(" record_success -- breaker [%s] closed", self.name)
+            self.opened = False
+            self.times_opened = 0
+            self.retry_at = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            half_open = self.__get_state() == STATE_HALF_OPEN
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            self.last_failure_time = self.clock()
+
+            if half_open or (not self.opened and self.consecutive_failures >= self.failure_threshold):
+                timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** self.times_opened)
+                # jitter keeps wallets and replicas that failed together from retrying together
+                timeout *= random.uniform(0.75, 1.25)
+                self.retry_at = self.last_failure_time + timeout
+                self.times_opened += 1
+                self.opened = True
+                log.warning(" record_failure -- breaker [%s] open for %.0fs after : %s",
+                            self.name, timeout, self.last_error)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'state': self.__get_state(),
+                'consecutive_failures': self.consecutive_failures,
+                'total_failures': self.total_failures,
+                'total_successes': self.total_successes,
+                'last_error': self.last_error,
+                'last_failure_time': self.last_failure_time,
+                'retry_at': self.retry_at,
+            }
+
+
+class BreakerRegistry:
+
+    def __init__(self, **breaker_kwargs):
+        self.breaker_kwargs = breaker_kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, **self.breaker_kwargs)
+            return self._breakers[name]
+
+    def snapshot(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.to_dict() for name, breaker in sorted(breakers.items())}
+
+
+_breaker_registry = None
+_breaker_registry_lock = threading.Lock()
+
+
+def get_breaker_registry():
+    """
+        Returns the process wide registry holding the breakers of every wallet and endpoint
+    :return:
+    """
+    global _breaker_registry
+    with _breaker_registry_lock:
+        if not _breaker_registry:
+            _breaker_registry = BreakerRegistry(
+                failure_threshold=int(os.getenv(ENVIRONMENT_BREAKER_FAILURE_THRESHOLD_KEY, 3)),
+                reset_timeout=float(os.getenv(ENVIRONMENT_BREAKER_RESET_TIMEOUT_KEY, 60)),
+                max_reset_timeout=float(os.getenv(ENVIRONMENT_BREAKER_MAX_RESET_TIMEOUT_KEY, 3600)))
+        return _breaker_registry
+
+
+def get_endpoint_breaker(endpoint_uri):
+    return get_breaker_registry().get(f'endpoint:{endpoint_uri}')
+
+
+@contextlib.contextmanager
+def endpoint_guard(endpoint_uri):
+    """
+        Fails fast while the endpoint's breaker is open, otherwise records the outcome of the request.
+        Connection errors, timeouts and http errors count as failures, throttling is left to the rate limiter.
+    :param endpoint_uri:
+    :return:
+    """
+    endpoint_breaker = get_endpoint_breaker(endpoint_uri)
+    if not endpoint_breaker.allow():
+        raise CircuitOpenError(f'{endpoint_breaker.name} is unavailable until {endpoint_breaker.retry_at}')
+
+    try:
+        yield endpoint_breaker
+    except OSError as e:
+        if getattr(getattr(e, 'response', None), 'status_code', None) == 429:
+            endpoint_breaker.record_success()
+        else:
+            endpoint_breaker.record_failure(e)
+        raise
+    except Exception:
+        # the endpoint answered, whatever went wrong is not its availability
+        endpoint_breaker.record_success()
+        raise
+    else:
+        endpoint_breaker.record_success()
+
+
+def circuit_breaker_middleware(make_request, web3_connection):
+    """
+        Web3 middleware failing fast while the endpoint's breaker is open instead of
+        waiting on an endpoint that keeps timing out or refusing connections.
+    :param make_request:
+    :param web3_connection:
+    :return:
+    """
+    endpoint_uri = getattr(web3_connection.provider, 'endpoint_uri', type(web3_connection.provider).__name__)
+
+    def middleware(method, params):
+        with endpoint_guard(endpoint_uri):
+            return make_request(method, params)
+
+    return middleware
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_CONFIG_FILE_KEY = 'CONFIG_FILE'
+ENVIRONMENT_CONFIG_WATCH_INTERVAL_KEY = 'CONFIG_WATCH_INTERVAL'
+
+
+def to_environment_value(value):
+    """
+        Config values are stored the way their environment variable expects them, lists become
+        comma separated and maps become name|value pairs e.g. the wallets of PRIVATE_KEY_MAP
+    :param value:
+    :return:
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ','.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return ','.join(f'{name}|{item}' for name, item in value.items())
+    return json.dumps(value)
+
+
+class ConfigFile:
+    """
+        JSON object of environment variable names to values layered over the process environment.
+
+        Every setting is read from the environment where it is used so a reload only has to update the
+        variables that changed, the running components pick them up on their next use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values = {}
+        self.modified_time = None
+        # the environment a setting had before the file overrode it, restored once it leaves the file
+        self._environment_defaults = {}
+
+    def has_changed(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.modified_time
+        except OSError:
+            return False
+
+    def load(self):
+        """
+            Reads the file and applies the settings that differ from the last load
+        :return: the names of the settings that changed
+        """
+        # a broken file is reported once instead of on every watch
+        self.modified_time = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r') as f:
+            values = json.load(f)
+        if not isinstance(values, dict):
+            raise ValueError(f'{self.path} must hold a json object of setting names to values')
+        values = {key: to_environment_value(value) for key, value in values.items()}
+
+        changed_keys = {key for key in self.values.keys() | values.keys() if self.values.get(key) != values.get(key)}
+        for key in changed_keys:
+            if key in values:
+                self._environment_defaults.setdefault(key, os.environ.get(key))
+                os.environ[key] = values[key]
+            elif self._environment_defaults.get(key) is not None:
+                os.environ[key] = self._environment_defaults.pop(key)
+            else:
+                self._environment_defaults.pop(key, None)
+                os.environ.pop(key, None)
+
+        self.values = values
+        return changed_keys
+
+
+def get_config_file():
+    """
+        The config file set by CONFIG_FILE, None when everything comes from the environment
+    :return:
+    """
+    config_file_path = os.getenv(ENVIRONMENT_CONFIG_FILE_KEY)
+    if not config_file_path:
+        return None
+
+    config_file = ConfigFile(config_file_path)
+    config_file.load()
+    log.info(" get_config_file -- loaded %s settings from %s", len(config_file.values), config_file_path)
+    return config_file
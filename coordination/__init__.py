@@ -0,0 +1,119 @@
+import abc
+import math
+import os
+import socket
+
+
+def get_default_replica_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def rebalance_leases(replica_id: str, wallets: list, replicas: dict, leases: dict, now: float, lease_duration: float):
+    """
+        Renews the replica's heartbeat and leases and rebalances the fleet, mutating the given state.
+
+        Every live replica holds at most its fair share of the wallets. A replica holding more releases
+        the excess so a new replica can pick it up, and leases of dead replicas expire and are taken over.
+
+    :param replica_id:
+    :param wallets: identifiers of every wallet in the fleet
+    :param replicas: dict of replica id to heartbeat expiry
+    :param leases: dict of wallet to (owner replica id, lease expiry)
+    :param now:
+    :param lease_duration:
+    :return: sorted wallets the replica holds
+    """
+    replicas[replica_id] = now + lease_duration
+    for dead_replica_id in [other_id for other_id, expires_at in replicas.items() if expires_at <= now]:
+        del replicas[dead_replica_id]
+
+    for wallet in [wallet for wallet, (owner, expires_at) in leases.items()
+                   if expires_at <= now or owner not in replicas]:
+        del leases[wallet]
+
+    fair_share = math.ceil(len(wallets) / len(replicas))
+
+    fleet = set(wallets)
+    held_wallets = sorted(wallet for wallet, (owner, _) in leases.items() if owner == replica_id and wallet in fleet)
+    for released_wallet in held_wallets[fair_share:]:
+        del leases[released_wallet]
+    held_wallets = held_wallets[:fair_share]
+
+    free_wallets = [wallet for wallet in wallets if wallet not in leases]
+    held_wallets += free_wallets[:max(0, fair_share - len(held_wallets))]
+
+    for wallet in held_wallets:
+        leases[wallet] = (replica_id, now + lease_duration)
+
+    return sorted(held_wallets)
+
+
+def renew_leases(replica_id: str, wallets: list, replicas: dict, leases: dict, now: float, lease_duration: float):
+    """
+        Extends the replica's unexpired leases on the given wallets without rebalancing, mutating the given state.
+        Called right before sending transactions so a long cycle can not act on wallets taken over meanwhile.
+
+    :param replica_id:
+    :param wallets: identifiers of the wallets about to be acted on
+    :param replicas: dict of replica id to heartbeat expiry
+    :param leases: dict of wallet to (owner replica id, lease expiry)
+    :param now:
+    :param lease_duration:
+    :return: sorted wallets the replica still holds
+    """
+    held_wallets = sorted(wallet for wallet in set(wallets)
+                          if wallet in leases and leases[wallet][0] == replica_id and leases[wallet][1] > now)
+    for wallet in held_wallets:
+        leases[wallet] = (replica_id, now + lease_duration)
+    if held_wallets:
+        replicas[replica_id] = now + lease_duration
+
+    return held_wallets
+
+
+class LeaseManagerInterface(metaclass=abc.ABCMeta):
+    """
+        Coordinates replicas sharing a wallet fleet, each wallet is only processed by the replica holding its lease.
+    """
+
+    def __init__(self, replica_id: str = None, lease_duration: float = 900):
+        self.replica_id = replica_id or get_default_replica_id()
+        self.lease_duration = lease_duration
+
+    @classmethod
+    def __subclasshook__(cls, subclass):
+        return (hasattr(subclass, 'setup') and
+                callable(subclass.setup) and
+                hasattr(subclass, 'claim') and
+                callable(subclass.claim) and
+                hasattr(subclass, 'renew') and
+                callable(subclass.renew) and
+                hasattr(subclass, 'release') and
+                callable(subclass.release) or
+                NotImplemented)
+
+    @abc.abstractmethod
+    def setup(self):
+        """Initiates the lease storage"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim(self, wallets: list):
+        """Renews this replica's leases and claims its share of free ones
+
+        :param wallets: identifiers of every wallet in the fleet
+        :return: the wallets this replica holds"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def renew(self, wallets: list):
+        """Extends this replica's leases on the wallets before acting on them, without rebalancing
+
+        :param wallets: identifiers of the wallets about to be acted on
+        :return: the wallets this replica still holds"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def release(self):
+        """Releases every lease held by this replica so others can take over right away"""
+        raise NotImplementedError
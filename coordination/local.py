@@ -0,0 +1,46 @@
+import threading
+import time
+
+from coordination import LeaseManagerInterface, rebalance_leases, renew_leases
+
+
+class LocalLeaseStore:
+    """
+        In memory lease storage, replicas sharing an instance behave like replicas sharing a database.
+    """
+
+    def __init__(self):
+        self.replicas = {}
+        self.leases = {}
+        self.lock = threading.Lock()
+
+
+class LocalLeaseManager(LeaseManagerInterface):
+    """
+        Stand in backend for a single process and for exercising the lease logic without a database
+    """
+
+    def __init__(self, replica_id: str = None, lease_duration: float = 900, store: LocalLeaseStore = None,
+                 clock=time.time):
+        super().__init__(replica_id=replica_id, lease_duration=lease_duration)
+        self.store = store or LocalLeaseStore()
+        self.clock = clock
+
+    def setup(self):
+        pass
+
+    def claim(self, wallets: list):
+        with self.store.lock:
+            return rebalance_leases(self.replica_id, list(wallets), self.store.replicas, self.store.leases,
+                                    now=self.clock(), lease_duration=self.lease_duration)
+
+    def renew(self, wallets: list):
+        with self.store.lock:
+            return renew_leases(self.replica_id, list(wallets), self.store.replicas, self.store.leases,
+                                now=self.clock(), lease_duration=self.lease_duration)
+
+    def release(self):
+        with self.store.lock:
+            self.store.replicas.pop(self.replica_id, None)
+            for wallet in [wallet for wallet, (owner, _) in self.store.leases.items() if owner == self.replica_id]:
+                del self.store.leases[wallet]
@@ -0,0 +1,97 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from coordination import LeaseManagerInterface, rebalance_leases, renew_leases
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_LEASE_DATABASE_KEY = 'LEASE_DATABASE'
+
+
+class SqliteLeaseManager(LeaseManagerInterface):
+    """
+        Lease backend for replicas on one host or sharing a volume, sqlite's write lock
+        serialises the claims of competing replicas.
+    """
+
+    def __init__(self, replica_id: str = None, lease_duration: float = 900, database: str = None):
+        super().__init__(replica_id=replica_id, lease_duration=lease_duration)
+        self.database = database or os.getenv(ENVIRONMENT_LEASE_DATABASE_KEY, 'leases.sqlite')
+        self.connection = None
+        # the connection is shared by the protocol threads, sqlite allows one transaction on it at a time
+        self.lock = threading.Lock()
+
+    def setup(self):
+        with self.lock:
+            self.__connect()
+
+    def __connect(self):
+        if self.connection:
+            return
+
+        self.connection = sqlite3.connect(self.database, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS replicas (replica_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS wallet_leases '
+            '(wallet TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    def claim(self, wallets: list):
+        held_wallets = self.__update_leases(rebalance_leases, wallets)
+        log.debug(" claim -- replica [%s] holds %s of %s wallets", self.replica_id, len(held_wallets), len(wallets))
+        return held_wallets
+
+    def renew(self, wallets: list):
+        return self.__update_leases(renew_leases, wallets)
+
+    def __update_leases(self, update_function, wallets: list):
+        """
+            Applies a lease update function to the stored state inside one write transaction
+        :param update_function: rebalance_leases or renew_leases
+        :param wallets:
+        :return: the wallets this replica holds
+        """
+        with self.lock:
+            self.__connect()
+
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                replicas = dict(cursor.execute('SELECT replica_id, expires_at FROM replicas'))
+                leases = {wallet: (owner, expires_at) for wallet, owner, expires_at in
+                          cursor.execute('SELECT wallet, owner, expires_at FROM wallet_leases')}
+                previous_replicas, previous_leases = dict(replicas), dict(leases)
+
+                held_wallets = update_function(self.replica_id, list(wallets), replicas, leases,
+                                               now=time.time(), lease_duration=self.lease_duration)
+
+                cursor.executemany('DELETE FROM replicas WHERE replica_id = ?',
+                                   [(replica_id,) for replica_id in previous_replicas if replica_id not in replicas])
+                cursor.executemany('INSERT OR REPLACE INTO replicas (replica_id, expires_at) VALUES (?, ?)',
+                                   [(replica_id, expires_at) for replica_id, expires_at in replicas.items()
+                                    if previous_replicas.get(replica_id) != expires_at])
+                cursor.executemany('DELETE FROM wallet_leases WHERE wallet = ?',
+                                   [(wallet,) for wallet in previous_leases if wallet not in leases])
+                cursor.executemany('INSERT OR REPLACE INTO wallet_leases (wallet, owner, expires_at) VALUES (?, ?, ?)',
+                                   [(wallet, owner, expires_at) for wallet, (owner, expires_at) in leases.items()
+                                    if previous_leases.get(wallet) != (owner, expires_at)])
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+        return held_wallets
+
+    def release(self):
+        with self.lock:
+            if not self.connection:
+                return
+
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('DELETE FROM wallet_leases WHERE owner = ?', (self.replica_id,))
+            cursor.execute('DELETE FROM replicas WHERE replica_id = ?', (self.replica_id,))
+            cursor.execute('COMMIT')
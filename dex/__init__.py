@@ -1,9 +1,11 @@
 import abc
-
-from eth_account.signers.local import LocalAccount
+from typing import TYPE_CHECKING
 
 from notification import NotifierInterface
 
+if TYPE_CHECKING:
+    from eth_account.signers.local import LocalAccount
+
 
 class DexInterface(metaclass=abc.ABCMeta):
 
@@ -34,10 +36,24 @@ class DexInterface(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def swap(self, account: LocalAccount, amount_to_swap: float):
+    def swap(self, account: 'LocalAccount', amount_to_swap: float):
         """Swaps the amount of native token generated to the network native token
 
         :param account:
         :param amount_to_swap:
         """
         raise NotImplementedError
+
+    def swap_many(self, swaps: list):
+        """Swaps for several wallets, implementations able to batch the swaps should override it
+
+        :param swaps: list of (account, amount_to_swap)
+        :return: list of the receipt or the exception of each swap
+        """
+        results = []
+        for account, amount_to_swap in swaps:
+            try:
+                results.append(self.swap(account=account, amount_to_swap=amount_to_swap))
+            except Exception as e:
+                results.append(e)
+        return results
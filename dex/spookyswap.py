@@ -1,4 +1,5 @@
 import logging
+import threading
 from datetime import datetime, timedelta
 
 import web3
@@ -6,21 +7,31 @@ from eth_account.signers.local import LocalAccount
 
 from dex import DexInterface
 from notification import NotifierInterface
-from utility import get_network_connection, get_contract
+from utility import batch_call, broadcast_transaction, get_network_connection, get_contract, send_transaction, \
+    wait_for_transaction
 
 log = logging.getLogger(__name__)
 
 dex_contract_abi = '[{"inputs":[{"internalType":"uint256","name":"amountIn","type":"uint256"},{"internalType":"uint256","name":"amountOutMin","type":"uint256"},{"internalType":"address[]","name":"path","type":"address[]"},{"internalType":"address","name":"to","type":"address"},{"internalType":"uint256","name":"deadline","type":"uint256"}],"name":"swapExactTokensForETH","outputs":[{"internalType":"uint256[]","name":"amounts","type":"uint256[]"}],"stateMutability":"nonpayable","type":"function"}]'
+token_contract_abi = '[{"inputs":[{"internalType":"address","name":"owner","type":"address"},{"internalType":"address","name":"spender","type":"address"}],"name":"allowance","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"spender","type":"address"},{"internalType":"uint256","name":"amount","type":"uint256"}],"name":"approve","outputs":[{"internalType":"bool","name":"","type":"bool"}],"stateMutability":"nonpayable","type":"function"}]'
+
+MAX_UINT256 = 2 ** 256 - 1
 
 
 class SpookySwap(DexInterface):
     POWER_TOKEN_CONTRACT = '0x131c7afb4E5f5c94A27611f7210dfEc2215E85Ae'
     WFTM_TOKEN_CONTRACT = '0x21be370D5312f44cB42ce377BC9b8a0cEF1A4C83'
+    ROUTER_CONTRACT = '0xf491e7b69e4244ad4002bc14e878a34207e38c29'
 
     def __init__(self, notifier: NotifierInterface):
         super().__init__(notifier=notifier)
         self.ftm_connection = None
         self.dex_contract = None
+        self.token_contract = None
+
+        # router allowance of every wallet, read once and then tracked locally as swaps consume it
+        self.allowances = dict()
+        self._allowances_lock = threading.Lock()
 
     def setup(self):
         """
@@ -30,8 +41,11 @@ class SpookySwap(DexInterface):
         self.ftm_connection = get_network_connection(self.ftm_connection)
 
         self.dex_contract = get_contract(self.ftm_connection,
-                                         **dict(address='0xf491e7b69e4244ad4002bc14e878a34207e38c29',
+                                         **dict(address=self.ROUTER_CONTRACT,
                                                 abi=dex_contract_abi))
+        self.token_contract = get_contract(self.ftm_connection,
+                                           **dict(address=self.POWER_TOKEN_CONTRACT,
+                                                  abi=token_contract_abi))
 
     def can_swap_to_native(self, min_rate_allowed: float):
         """Obtains the node reward balance in an accounts the wallet.
@@ -40,32 +54,100 @@ class SpookySwap(DexInterface):
 
         return True
 
-    def swap(self, account: LocalAccount, amount_to_swap: float):
-        """Swaps the amount of native token generated to the network native token
+    def load_allowances(self, wallet_addresses: list):
+        """
+            Reads the router allowance of the wallets not seen yet in one batched rpc request
 
-        :param account:
-        :param amount_to_swap:
+        :param wallet_addresses:
+        :return:
+        """
+        with self._allowances_lock:
+            unknown_addresses = [address for address in wallet_addresses if address not in self.allowances]
+        if not unknown_addresses:
+            return
+
+        router_address = self.dex_contract.address
+        allowances = batch_call(self.ftm_connection, [
+            self.token_contract.functions.allowance(address, router_address) for address in unknown_addresses])
+        with self._allowances_lock:
+            self.allowances.update(zip(unknown_addresses, allowances))
+
+    def ensure_allowance(self, account: LocalAccount, amount_in: int):
         """
-        nonce = self.dex_contract.web3.eth.get_transaction_count(account.address)
-        gas_price = self.dex_contract.web3.eth.gas_price
+            Approves the router once for the maximum amount when the tracked allowance does
+            not cover the swap, so later swaps need no approval at all.
 
+        :param account:
+        :param amount_in:
+        :return:
+        """
+        self.load_allowances([account.address])
+        if self.allowances[account.address] >= amount_in:
+            return
+
+        approve_tx_receipt = send_transaction(
+            self.token_contract.functions.approve(self.dex_contract.address, MAX_UINT256), account)
+        log.info(" ensure_allowance -- approved router for [%s] with receipt  %s", account.address, approve_tx_receipt)
+        with self._allowances_lock:
+            self.allowances[account.address] = MAX_UINT256
+
+    def __consume_allowance(self, wallet_address: str, amount_in: int):
+        with self._allowances_lock:
+            if self.allowances.get(wallet_address, 0) < MAX_UINT256:
+                self.allowances[wallet_address] = max(0, self.allowances.get(wallet_address, 0) - amount_in)
+
+    def __broadcast_swap(self, account: LocalAccount, amount_to_swap: float):
         amount_in = web3.Web3.toWei(amount_to_swap, 'ether')
         amount_out_min = web3.Web3.toWei(amount_to_swap, 'ether')
         path_out = [self.POWER_TOKEN_CONTRACT, self.WFTM_TOKEN_CONTRACT]
         tx_deadline = datetime.now() + timedelta(hours=1)
 
-        swap_tx = self.dex_contract.functions.swapExactTokensForETH(
-            amount_in, amount_out_min, path_out, account.address, int(tx_deadline.timestamp())). \
-            buildTransaction(
-            {
-                'from': account.address,
-                'nonce': nonce,
-                "gasPrice": gas_price,
-            }
-        )
-
-        signed_swap_txn = account.sign_transaction(swap_tx)
-        swap_tx_hash = self.dex_contract.web3.eth.send_raw_transaction(signed_swap_txn.rawTransaction)
-
-        compound_tx_receipt = self.dex_contract.web3.eth.wait_for_transaction_receipt(swap_tx_hash)
-        log.info(" swap -- successfully swaped [%s] rewards with receipt  %s", amount_to_swap, compound_tx_receipt)
+        self.ensure_allowance(account, amount_in)
+
+        pending_swap = broadcast_transaction(self.dex_contract.functions.swapExactTokensForETH(
+            amount_in, amount_out_min, path_out, account.address, int(tx_deadline.timestamp())), account,
+            gas_shape='>'.join(path_out))
+        self.__consume_allowance(account.address, amount_in)
+        return pending_swap
+
+    def swap(self, account: LocalAccount, amount_to_swap: float):
+        """Swaps the amount of native token generated to the network native token
+
+        :param account:
+        :param amount_to_swap:
+        """
+        swap_tx_receipt = wait_for_transaction(self.__broadcast_swap(account, amount_to_swap))
+        log.info(" swap -- successfully swaped [%s] rewards with receipt  %s", amount_to_swap, swap_tx_receipt)
+
+    def swap_many(self, swaps: list):
+        """Swaps for several wallets at once. Allowances of all of them are read in one batch,
+        every swap is broadcast before any receipt is waited for.
+
+        :param swaps: list of (account, amount_to_swap)
+        :return: list of the receipt or the exception of each swap
+        """
+        self.load_allowances([account.address for account, _ in swaps])
+
+        pending_swaps = []
+        for account, amount_to_swap in swaps:
+            try:
+                pending_swaps.append(self.__broadcast_swap(account, amount_to_swap))
+            except Exception as e:
+                pending_swaps.append(e)
+
+        results = []
+        for (account, amount_to_swap), pending_swap in zip(swaps, pending_swaps):
+            if isinstance(pending_swap, Exception):
+                results.append(pending_swap)
+                continue
+            try:
+                swap_tx_receipt = wait_for_transaction(pending_swap)
+                log.info(" swap_many -- successfully swaped [%s] rewards of [%s] with receipt  %s",
+                         amount_to_swap, account.address, swap_tx_receipt)
+                results.append(swap_tx_receipt)
+            except Exception as e:
+                # the allowance may not have been consumed, read it again next time
+                with self._allowances_lock:
+                    self.allowances.pop(account.address, None)
+                results.append(e)
+        return results
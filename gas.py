@@ -0,0 +1,118 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_GAS_CACHE_FILE_KEY = 'GAS_CACHE_FILE'
+ENVIRONMENT_GAS_LIMIT_MARGIN_KEY = 'GAS_LIMIT_MARGIN'
+
+
+class GasLimitCache:
+    """
+        Learns the gas limit of transaction shapes from the gasUsed of their receipts so
+        transactions can be built without an eth_estimateGas round trip.
+
+        A shape is identified by the contract, the function and what drives its cost e.g. the tier or swap path.
+        The highest gas used seen for a shape plus a safety margin becomes its limit.
+    """
+
+    def __init__(self, cache_file=None, margin=0.2):
+        self.cache_file = cache_file
+        self.margin = margin
+        self._gas_used = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def get_key(contract_address: str, function_name: str, shape=''):
+        return f'{contract_address.lower()}:{function_name}:{shape}'
+
+    def get_gas_limit(self, key: str):
+        """
+            Returns the gas limit to use for the shape, None when it has to be estimated
+        :param key:
+        :return:
+        """
+        with self._lock:
+            gas_used = self._gas_used.get(key)
+        if gas_used is None:
+            return None
+        return int(gas_used * (1 + self.margin))
+
+    def learn(self, key: str, gas_used: int):
+        with self._lock:
+            if gas_used <= self._gas_used.get(key, 0):
+                return
+            self._gas_used[key] = gas_used
+        self.save()
+
+    def invalidate(self, key: str):
+        """
+            Forgets a shape e.g. after it ran out of gas so it is estimated again
+        :param key:
+        :return:
+        """
+        with self._lock:
+            if self._gas_used.pop(key, None) is None:
+                return
+        log.info(" invalidate -- gas limit of %s will be estimated again", key)
+        self.save()
+
+    def load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                gas_used = json.load(f)
+            with self._lock:
+                self._gas_used.update({key: int(value) for key, value in gas_used.items()})
+        except (OSError, ValueError):
+            log.warning(" load -- ignoring unreadable gas cache %s", self.cache_file, exc_info=True)
+
+    def save(self):
+        if not self.cache_file:
+            return
+        # saves are serialized so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                gas_used = dict(self._gas_used)
+
+            temp_file = None
+            try:
+                # the whole file is written aside and swapped in so readers never see a partial one
+                file_descriptor, temp_file = tempfile.mkstemp(
+                    dir=os.path.dirname(os.path.abspath(self.cache_file)),
+                    prefix=f'.{os.path.basename(self.cache_file)}.', suffix='.tmp')
+                with os.fdopen(file_descriptor, 'w') as f:
+                    json.dump(gas_used, f, indent=2, sort_keys=True)
+                os.replace(temp_file, self.cache_file)
+                temp_file = None
+            except OSError:
+                log.warning(" save -- unable to persist gas cache %s", self.cache_file, exc_info=True)
+            finally:
+                if temp_file:
+                    with contextlib.suppress(OSError):
+                        os.remove(temp_file)
+
+
+_gas_limit_cache = None
+_gas_limit_cache_lock = threading.Lock()
+
+
+def get_gas_limit_cache():
+    """
+        Returns the process wide gas limit cache, persisted to GAS_CACHE_FILE
+    :return:
+    """
+    global _gas_limit_cache
+    with _gas_limit_cache_lock:
+        if not _gas_limit_cache:
+            _gas_limit_cache = GasLimitCache(
+                cache_file=os.getenv(ENVIRONMENT_GAS_CACHE_FILE_KEY, 'gas_cache.json'),
+                margin=float(os.getenv(ENVIRONMENT_GAS_LIMIT_MARGIN_KEY, 0.2)))
+        return _gas_limit_cache
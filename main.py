@@ -1,8 +1,12 @@
 import logging
 import os
+import signal
+import threading
 import time
 
-from application import Exponentiator
+from application import ENVIRONMENT_COMPOUND_PCT_KEY, Exponentiator
+from config import ENVIRONMENT_CONFIG_WATCH_INTERVAL_KEY
+from tracing import profile_cycle
 from utility import get_service_name
 
 log = logging.getLogger(__name__)
@@ -14,10 +18,13 @@ class DaemonApp:
 
     def __init__(self):
         self.exponentiator = None
+        self._reload_requested = threading.Event()
 
     def setup(self, application_name):
 
         self.exponentiator = Exponentiator()
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_requested.set())
         log.debug(" setup -- Setting up application configuration for [%s]", application_name)
 
     def run(self, application_name):
@@ -28,37 +35,68 @@ class DaemonApp:
         while should_run:
 
             try:
-                self.exponentiator.execute_check(compound_pct=100)
+                with profile_cycle(application_name):
+                    self.exponentiator.execute_check(
+                        compound_pct=int(os.getenv(ENVIRONMENT_COMPOUND_PCT_KEY, 100)))
 
-                sleep_duration = os.getenv(ENVIRONMENT_SLEEP_DURATION_KEY, 5 * 60)
-                log.debug(" run -- sleeping for %s before checking again, Edit Env [%s]", sleep_duration,
-                          ENVIRONMENT_SLEEP_DURATION_KEY)
-                time.sleep(sleep_duration)
+                log.debug(" run -- sleeping for %s before checking again, Edit Env [%s]",
+                          os.getenv(ENVIRONMENT_SLEEP_DURATION_KEY, 5 * 60), ENVIRONMENT_SLEEP_DURATION_KEY)
+                self.sleep()
                 error_retry_duration = 1
 
             except KeyboardInterrupt:
+                self.clean_up()
                 exit(0)
             except Exception as e:
                 log.error(" run -- seems there is an issue executing check ", exc_info=True)
 
                 # when there are errors in the network we wait for a shorter period before retrying
-                # Using an exponential retry mechanism until we are waiting for 10 minutes
+                # Using an exponential retry mechanism up to the usual sleep duration, failing wallets
+                # and endpoints back off on their own through their circuit breakers
 
-                if error_retry_duration < 600:
+                if error_retry_duration < float(os.getenv(ENVIRONMENT_SLEEP_DURATION_KEY, 5 * 60)):
                     error_retry_duration *= 2
 
-                time.sleep(error_retry_duration)
-
-    @classmethod
-    def clean_up(cls):
-        pass
-
-    @classmethod
-    def reload_configs(cls):
-        pass
+                self.sleep(error_retry_duration)
+
+    def clean_up(self):
+        if self.exponentiator:
+            self.exponentiator.clean_up()
+
+    def sleep(self, duration=None):
+        """
+            Sleeps until the next check, reloading the config on SIGHUP or when the config file changes.
+            A changed sleep duration applies to the sleep already in progress.
+        :param duration: seconds to sleep instead of the sleep duration e.g. the backoff after an error
+        :return:
+        """
+        config_file = self.exponentiator.config_file
+        watch_interval = float(os.getenv(ENVIRONMENT_CONFIG_WATCH_INTERVAL_KEY, 10))
+        sleep_start = time.monotonic()
+
+        while True:
+            sleep_duration = duration or float(os.getenv(ENVIRONMENT_SLEEP_DURATION_KEY, 5 * 60))
+            remaining_duration = sleep_start + sleep_duration - time.monotonic()
+            if remaining_duration <= 0:
+                return
+
+            reload_requested = self._reload_requested.wait(min(remaining_duration, watch_interval))
+            if reload_requested or (config_file and config_file.has_changed()):
+                self._reload_requested.clear()
+                try:
+                    self.reload_configs()
+                except Exception:
+                    # the sleep also runs the error backoff, a failed reload must not end the daemon
+                    log.error(" sleep -- unable to apply the reloaded config ", exc_info=True)
+
+    def reload_configs(self):
+        if self.exponentiator:
+            self.exponentiator.reload_config()
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
     daemon_app = DaemonApp()
     daemon_app.setup(application_name=get_service_name())
     daemon_app.run(application_name=get_service_name())
@@ -1,11 +1,16 @@
 import abc
-
-from eth_account import Account
-from eth_account.signers.local import LocalAccount
+import logging
+from typing import TYPE_CHECKING
 
 from dex import DexInterface
 from notification import NotifierInterface
 
+if TYPE_CHECKING:
+    from eth_account import Account
+    from eth_account.signers.local import LocalAccount
+
+log = logging.getLogger(__name__)
+
 
 class NodeInterface(metaclass=abc.ABCMeta):
 
@@ -69,16 +74,76 @@ class NodeInterface(metaclass=abc.ABCMeta):
         """Extract text from the data set"""
         raise NotImplementedError
 
+    def get_investment(self, wallet_address: str):
+        """Obtains the balance, node count and rewards of a wallet, implementations able to
+        batch these reads should override it.
+
+        :param wallet_address:
+        :return: dict"""
+        return {
+            'balance': self.get_wallet_balance(wallet_address),
+            'node_count': self.get_node_count(wallet_address),
+            'rewards': self.get_account_rewards_balance(wallet_address)}
+
+    def get_portfolio(self, wallets: dict):
+        """Obtains the investments of every wallet as a portfolio, implementations able to
+        batch these reads should override it. Wallets whose reads fail are left out, the errors other
+        than a wallet without nodes are kept in the portfolio's read_errors.
+
+        :param wallets: dict of wallet name to wallet address
+        :return: Portfolio"""
+        from portfolio import Portfolio, to_wei
+
+        portfolio = Portfolio()
+        for wallet_name, wallet_address in wallets.items():
+            try:
+                investment = self.get_investment(wallet_address)
+            except Exception as e:
+                if 'NO NODE OWNER' in str(e):
+                    log.info("Account [%s] had no nodes attached", wallet_name)
+                else:
+                    log.warning(" get_portfolio -- Account [%s] experienced a contract error %s", wallet_name, e)
+                    portfolio.read_errors[wallet_name] = e
+                continue
+
+            portfolio.add(wallet_name, wallet_address, balance_wei=to_wei(investment['balance']),
+                          node_count=investment['node_count'], rewards_wei=to_wei(investment['rewards']))
+        return portfolio
+
+    def can_compound_many(self, portfolio, compound_pct=100):
+        """Checks every wallet of a portfolio for compounding opportunities
+
+        :param portfolio:
+        :param compound_pct:
+        :return: list of booleans in portfolio order"""
+        return [self.can_compound(wallet.to_investment(), compound_pct=compound_pct) for wallet in portfolio]
+
     @abc.abstractmethod
     def can_compound(self, investment: dict, compound_pct=100):
         """Checks populated investment for compounding opportunities"""
         raise NotImplementedError
 
     @abc.abstractmethod
-    def compound(self, account: Account, compounding_name: str):
-        """Internal method responsible for auto compounding our rewards whenever they are ready."""
+    def compound(self, account: 'Account', compounding_name: str, investment: dict = None, compound_pct=100):
+        """Internal method responsible for auto compounding our rewards whenever they are ready.
+
+        The daemon always passes the investment it just read and the share of rewards to compound,
+        plugins written against the older compound(account, compounding_name) have to accept both.
+
+        :param account:
+        :param compounding_name:
+        :param investment: balance, node count and rewards of the wallet
+        :param compound_pct: percentage of the rewards to compound
+        :return: True when something was compounded"""
         raise NotImplementedError
 
+    def plan_transactions(self, account: 'LocalAccount', compounding_name: str, investment: dict, compound_pct=100):
+        """Plans the transactions compounding the wallet would send so they can be simulated
+        before any is broadcast. Plugins that can not plan return None and are compounded directly.
+
+        :return: list of PlannedTransaction"""
+        return None
+
     @abc.abstractmethod
     def get_compounding_name(self, wallet_address: str):
         """Extract text from the data set"""
@@ -89,6 +154,31 @@ class NodeInterface(metaclass=abc.ABCMeta):
         """Returns the amount of rewards a node can produce"""
         raise NotImplementedError
 
+    def get_generation_capacity(self, investment: dict, interval_in_hours=24):
+        """Rewards the nodes of the wallet generate over the interval, implementations whose
+        tiers earn different rewards should override it.
+
+        :param investment:
+        :param interval_in_hours:
+        :return:"""
+        return investment['node_count'] * self.get_reward_per_hour() * interval_in_hours
+
+    def get_generation_capacity_many(self, investments: list, interval_in_hours=24):
+        """Generation capacity of every investment, implementations able to batch the reads
+        behind it should override it.
+
+        :param investments:
+        :param interval_in_hours:
+        :return: list of capacities in investments order, the exception for investments that failed"""
+        generation_capacities = []
+        for investment in investments:
+            try:
+                generation_capacities.append(
+                    self.get_generation_capacity(investment, interval_in_hours=interval_in_hours))
+            except Exception as e:
+                generation_capacities.append(e)
+        return generation_capacities
+
     @abc.abstractmethod
     def get_reward_in_usd(self):
         """ This function gets the cost of one POWER unit in USD
@@ -96,7 +186,7 @@ class NodeInterface(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def claim_rewards(self, account: LocalAccount, compound_pct=100):
+    def claim_rewards(self, account: 'LocalAccount', compound_pct=100):
         """ This function claims rewards from a compounding node farm
         utilizing the compounding factor to determine what to leave behind
         """
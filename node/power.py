@@ -4,12 +4,12 @@ import random
 
 import web3
 from eth_account.signers.local import LocalAccount
-from pycoingecko import CoinGeckoAPI
 
-from dex.spookyswap import SpookySwap
 from node import NodeInterface
 from notification import NotifierInterface
-from utility import get_contract, get_network_connection
+from portfolio import Portfolio, to_wei
+from preflight import ACTION_CLAIM, ACTION_COMPOUND, PlannedTransaction
+from utility import batch_call, get_contract, get_network_connection, send_transaction
 
 log = logging.getLogger(__name__)
 
@@ -24,7 +24,11 @@ class PowerNode(NodeInterface):
     NODE_TYPE_SOLAR = 'MICROSCOPIC'
     NODE_TYPE_WIND = 'FLATVERSAL'
 
-    tier_list = [NODE_TYPE_NUCLEAR]
+    # ordered from the highest to the lowest tier, the rewards of every tier are read and compounded
+    tier_list = [NODE_TYPE_NUCLEAR, NODE_TYPE_HYDRO, NODE_TYPE_SOLAR, NODE_TYPE_WIND]
+
+    # only tiers with a verified daily reward and creation cost are compounded into,
+    # add the other tiers once they are confirmed against the protocol's tier table
     NODE_REWARD_MAP = {
         NODE_TYPE_NUCLEAR: 0.7
     }
@@ -58,6 +62,8 @@ class PowerNode(NodeInterface):
         self.super_human_contract = get_contract(self.ftm_connection,
                                                  **dict(address='0xC8007751603bB3E45834A59af64190Bb618b4a83',
                                                         abi=super_human_contract_abi))
+        if self.dex and self.dex.ftm_connection is not self.ftm_connection:
+            self.dex.setup()
 
     def get_dex(self):
         """
@@ -66,6 +72,8 @@ class PowerNode(NodeInterface):
         """
 
         if not self.dex:
+            from dex.spookyswap import SpookySwap
+
             self.dex = SpookySwap(notifier=self.notifier)
             self.dex.setup()
         return self.dex
@@ -88,6 +96,17 @@ class PowerNode(NodeInterface):
         """
         return self.tier_contract.functions.getNodeNumberOf(wallet_address).call()
 
+    def get_tier_rewards(self, wallet_address):
+        """
+            Obtains the rewards of every tier in a single batched rpc request.
+
+        :param wallet_address:
+        :return: dict of tier name to rewards
+        """
+        tier_rewards = batch_call(self.ftm_connection, [
+            self.tier_contract.functions.getRewardAmountOf(wallet_address, tier) for tier in self.tier_list])
+        return {tier: web3.Web3.fromWei(rewards, 'ether') for tier, rewards in zip(self.tier_list, tier_rewards)}
+
     def get_account_rewards_balance(self, wallet_address):
         """
             Obtains the rewards tied to the wallet for all the running nodes.
@@ -96,45 +115,118 @@ class PowerNode(NodeInterface):
         :return:
         """
 
-        account_rewards = 0
-        for tier in self.tier_list:
-            tier_rewards = self.tier_contract.functions.getRewardAmountOf(wallet_address, tier).call()
-            account_rewards += web3.Web3.fromWei(tier_rewards, 'ether')
-        return account_rewards
+        return sum(self.get_tier_rewards(wallet_address).values())
 
-    def compound(self, account: LocalAccount, compounding_name: str):
+    def __get_investment_calls(self, wallet_address: str):
+        return [
+            self.main_contract.functions.balanceOf(wallet_address),
+            self.tier_contract.functions.getNodeNumberOf(wallet_address),
+            *[self.tier_contract.functions.getRewardAmountOf(wallet_address, tier) for tier in self.tier_list]]
+
+    def get_investment(self, wallet_address: str):
+        """
+            Reads the balance, node count and the rewards of every tier with one batched rpc request.
+
+        :param wallet_address:
+        :return:
+        """
+        wallet_balance, node_count, *tier_rewards = batch_call(self.ftm_connection,
+                                                               self.__get_investment_calls(wallet_address))
+
+        tier_rewards = {
+            tier: web3.Web3.fromWei(rewards, 'ether') for tier, rewards in zip(self.tier_list, tier_rewards)}
+        return {
+            'balance': web3.Web3.fromWei(wallet_balance, 'ether'),
+            'node_count': node_count,
+            'rewards': sum(tier_rewards.values()),
+            'tier_rewards': tier_rewards}
+
+    def get_portfolio(self, wallets: dict):
+        """
+            Reads the investments of every wallet in batched rpc requests straight into a portfolio.
+            Wallets whose reads revert e.g. with no nodes attached are left out, only unexpected errors
+            are kept in the portfolio's read_errors.
+
+        :param wallets: dict of wallet name to wallet address
+        :return:
+        """
+        calls_per_wallet = 2 + len(self.tier_list)
+        results = batch_call(self.ftm_connection, [
+            contract_call for wallet_address in wallets.values()
+            for contract_call in self.__get_investment_calls(wallet_address)], raise_errors=False)
+
+        portfolio = Portfolio(tiers=self.tier_list)
+        for offset, (wallet_name, wallet_address) in zip(range(0, len(results), calls_per_wallet), wallets.items()):
+            wallet_balance, node_count, *tier_rewards = results[offset:offset + calls_per_wallet]
+
+            errors = [result for result in results[offset:offset + calls_per_wallet] if isinstance(result, Exception)]
+            if errors:
+                if 'NO NODE OWNER' in str(errors[0]):
+                    log.info("Account [%s] had no nodes attached", wallet_name)
+                else:
+                    log.warning(" get_portfolio -- Account [%s] experienced a contract error %s", wallet_name,
+                                errors[0])
+                    portfolio.read_errors[wallet_name] = errors[0]
+                continue
+
+            portfolio.add(wallet_name, wallet_address, balance_wei=wallet_balance, node_count=node_count,
+                          tier_rewards_wei=dict(zip(self.tier_list, tier_rewards)))
+        return portfolio
+
+    def compound(self, account: LocalAccount, compounding_name: str, investment: dict = None, compound_pct=100):
         """
             Internal method responsible for auto compounding our rewards whenever they are ready.
+            Only the tiers in the compounding plan get a transaction, each compounding into its best target tier.
 
         :param account:
         :param compounding_name:
-        :param tier:
+        :param investment:
+        :param compound_pct:
         :return:
         """
 
+        if not investment:
+            investment = self.get_investment(account.address)
+
         compounding_done = False
-        for tier in self.tier_list:
-            nonce = self.tier_contract.web3.eth.get_transaction_count(account.address)
-            gas_price = self.tier_contract.web3.eth.gas_price
-
-            compound_tx = self.tier_contract.functions.compoundTierInto(tier, tier, compounding_name). \
-                buildTransaction(
-                {
-                    'from': account.address,
-                    'nonce': nonce,
-                    "gasPrice": gas_price,
-                }
-            )
-
-            signed_compound_txn = account.sign_transaction(compound_tx)
-            compound_tx_hash = self.tier_contract.web3.eth.send_raw_transaction(signed_compound_txn.rawTransaction)
-
-            compound_tx_receipt = self.tier_contract.web3.eth.wait_for_transaction_receipt(compound_tx_hash)
-            log.info(" perform_compounding -- completed successful compounding of : [%s] with receipt  %s",
-                     compounding_name, compound_tx_receipt)
+        for planned_compound in self.__plan_compound_transactions(account, compounding_name, investment,
+                                                                  compound_pct=compound_pct):
+            compound_tx_receipt = planned_compound.submit()
+            log.info(" perform_compounding -- completed successful %s with receipt  %s",
+                     planned_compound.description, compound_tx_receipt)
             compounding_done = True
         return compounding_done
 
+    def __plan_compound_transactions(self, account: LocalAccount, compounding_name: str, investment: dict,
+                                     compound_pct=100):
+        return [
+            PlannedTransaction(
+                account, self.tier_contract.functions.compoundTierInto(tier, compound_tier, compounding_name),
+                action=ACTION_COMPOUND,
+                description=f'compounding of [{compounding_name}] from {tier} into {compound_tier}',
+                gas_shape=f'{tier}:{compound_tier}')
+            for tier, compound_tier in self.plan_compounding(investment, compound_pct=compound_pct)]
+
+    def plan_transactions(self, account: LocalAccount, compounding_name: str, investment: dict, compound_pct=100):
+        """
+            Plans the compounding transactions of the wallet followed by the claim of what is left over,
+            without signing or sending anything.
+
+        :param account:
+        :param compounding_name:
+        :param investment:
+        :param compound_pct:
+        :return: list of PlannedTransaction in submission order
+        """
+        planned_transactions = self.__plan_compound_transactions(account, compounding_name, investment,
+                                                                 compound_pct=compound_pct)
+        if planned_transactions:
+            planned_transactions.append(PlannedTransaction(
+                account, self.tier_contract.functions.cashoutAll(self.NODE_TYPE_NUCLEAR),
+                action=ACTION_CLAIM, description=f'claim of {self.NODE_TYPE_NUCLEAR} rewards',
+                gas_shape=self.NODE_TYPE_NUCLEAR))
+        return planned_transactions
+
     def get_reward_per_hour(self, **kwargs):
         """
             Obtains the amount of rewards a node can generate per hour
@@ -149,11 +241,47 @@ class PowerNode(NodeInterface):
 
         return self.NODE_REWARD_MAP[node_type] / 24
 
+    def __get_nuclear_node_count(self, investment: dict, node_names: str):
+        return min(investment['node_count'], len([name for name in node_names.split('#') if name]))
+
+    def get_generation_capacity(self, investment: dict, interval_in_hours=24):
+        """
+            Rewards the nodes of the wallet generate over the interval. The tier contract only exposes the
+            total node count so SUPERHUMAN nodes are counted from their names, nodes of tiers without a
+            verified reward are left out so the estimate never exceeds what was actually generated.
+
+        :param investment:
+        :param interval_in_hours:
+        :return:
+        """
+        node_names = self.super_human_contract.functions._getNodesNames(investment['address']).call()
+        return (self.__get_nuclear_node_count(investment, node_names) *
+                self.get_reward_per_hour(node_type=self.NODE_TYPE_NUCLEAR) * interval_in_hours)
+
+    def get_generation_capacity_many(self, investments: list, interval_in_hours=24):
+        """
+            Reads the node names of every wallet in one batched rpc request to estimate their generation capacity
+        :param investments:
+        :param interval_in_hours:
+        :return: list of capacities in investments order, the exception for wallets whose names could not be read
+        """
+        all_node_names = batch_call(self.ftm_connection, [
+            self.super_human_contract.functions._getNodesNames(investment['address'])
+            for investment in investments], raise_errors=False)
+
+        reward_per_interval = self.get_reward_per_hour(node_type=self.NODE_TYPE_NUCLEAR) * interval_in_hours
+        return [
+            node_names if isinstance(node_names, Exception) else
+            self.__get_nuclear_node_count(investment, node_names) * reward_per_interval
+            for investment, node_names in zip(investments, all_node_names)]
+
     def get_reward_in_usd(self, ):
         """
             This function gets the cost of one POWER unit in USD
         :return: USD value of rewards
         """
+        from pycoingecko import CoinGeckoAPI
+
         coin_gecko = CoinGeckoAPI()
         price = coin_gecko.get_price(ids='power-nodes', vs_currencies='usd')
         return decimal.Decimal(price['power-nodes']['usd'])
@@ -179,60 +307,111 @@ class PowerNode(NodeInterface):
         source_name_descendants = list(filter(lambda name: name.startswith(random_node_name), nodes_list))
         return f'{random_node_name}_{len(source_name_descendants)}'
 
-    def can_compound(self, investment: dict, compound_pct=100):
+    @staticmethod
+    def can_afford(rewards_wei: int, balance_wei: int, compounding_cost_wei: int, compound_pct=100):
         """
-            Checks populated investment for compounding opportunities
-        :param investment:
+            Checks whether rewards, topped up by the wallet balance when allowed,
+            cover the cost of a node given the share of rewards to compound.
+            Amounts are in wei and only integer math is used.
+        :param rewards_wei:
+        :param balance_wei:
+        :param compounding_cost_wei:
         :param compound_pct:
-        :param spend_pct:
         :return:
         """
-        node_type = investment.get('node_type', self.NODE_TYPE_NUCLEAR)
-        compounding_cost = self.NODE_CREATION_COST[node_type]
 
         if compound_pct <= 0 or compound_pct > 100:
             return False
 
-        rewards = investment['rewards']
-
-        true_compounding_cost = (100 / compound_pct * compounding_cost)
-
-        if rewards >= true_compounding_cost:
+        # rewards >= 100 / compound_pct * compounding_cost
+        if rewards_wei * compound_pct >= compounding_cost_wei * 100:
             return True
 
-        if rewards >= compounding_cost / 2:
+        if 2 * rewards_wei >= compounding_cost_wei:
 
-            if rewards + investment['balance'] > true_compounding_cost:
+            if (rewards_wei + balance_wei) * compound_pct > compounding_cost_wei * 100:
 
                 if compound_pct == 100:
                     return True
 
-                if investment['balance'] > compounding_cost:
+                if balance_wei > compounding_cost_wei:
                     return True
 
         return False
 
+    def __get_target_tier(self, node_type=None):
+        """
+            The tier to compound into. Every transaction costs about the same gas so the tier adding the most
+            rewards per transaction is the only target, compounding into a lesser tier now would spend the gas
+            on less than waiting until the rewards afford the better tier.
+        :param node_type: compounds into this tier instead
+        :return: (tier, creation cost in wei)
+        """
+        target_tier = node_type or max(self.NODE_CREATION_COST, key=lambda tier: self.NODE_REWARD_MAP[tier])
+        return target_tier, to_wei(self.NODE_CREATION_COST[target_tier])
+
+    def __plan_compounding(self, tier_rewards_wei: dict, balance_wei: int, target_tier: tuple, compound_pct=100):
+        compound_tier, compounding_cost_wei = target_tier
+        compounding_plan = []
+        for tier in sorted(tier_rewards_wei, key=self.tier_list.index, reverse=True):
+            rewards_wei = tier_rewards_wei[tier]
+            if self.can_afford(rewards_wei, balance_wei, compounding_cost_wei, compound_pct=compound_pct):
+                compounding_plan.append((tier, compound_tier))
+                # whatever the rewards do not cover is topped up from the wallet balance
+                balance_wei -= max(0, compounding_cost_wei - rewards_wei)
+
+        return compounding_plan
+
+    def plan_compounding(self, investment: dict, compound_pct=100):
+        """
+            Decides which tiers to compound. The rewards of every tier that can afford a node of the target tier
+            are compounded into it from the lowest tier to the highest, the others keep accruing until they can.
+
+        :param investment:
+        :param compound_pct:
+        :return: list of (tier, compound tier) pairs in submission order
+        """
+        tier_rewards = investment.get('tier_rewards') or {self.NODE_TYPE_NUCLEAR: investment['rewards']}
+        target_tier = self.__get_target_tier(investment.get('node_type'))
+
+        return self.__plan_compounding({tier: to_wei(rewards) for tier, rewards in tier_rewards.items()},
+                                       to_wei(investment['balance']), target_tier, compound_pct=compound_pct)
+
+    def can_compound(self, investment: dict, compound_pct=100):
+        """
+            Checks populated investment for compounding opportunities
+        :param investment:
+        :param compound_pct:
+        :return:
+        """
+        return bool(self.plan_compounding(investment, compound_pct=compound_pct))
+
+    def can_compound_many(self, portfolio: Portfolio, compound_pct=100):
+        """
+            Checks every wallet of the portfolio for compounding opportunities in one pass over its columns
+        :param portfolio:
+        :param compound_pct:
+        :return: list of booleans in portfolio order
+        """
+        if compound_pct <= 0 or compound_pct > 100:
+            return [False] * len(portfolio)
+
+        target_tier = self.__get_target_tier()
+        tier_columns = portfolio.tier_rewards_wei or {self.NODE_TYPE_NUCLEAR: portfolio.rewards_wei}
+        tiers = list(tier_columns)
+
+        return [
+            bool(self.__plan_compounding(dict(zip(tiers, tier_rewards_wei)), balance_wei, target_tier,
+                                         compound_pct=compound_pct))
+            for balance_wei, *tier_rewards_wei in zip(portfolio.balances_wei, *tier_columns.values())]
+
     def claim_rewards(self, account: LocalAccount, **kwargs):
         """ This function claims rewards from a compounding node farm
         utilizing the compounding factor to determine what to leave behind
         """
         node_type = kwargs.get('node_type', self.NODE_TYPE_NUCLEAR)
 
-        nonce = self.tier_contract.web3.eth.get_transaction_count(account.address)
-        gas_price = self.tier_contract.web3.eth.gas_price
-
-        claim_tx = self.tier_contract.functions.cashoutAll(node_type). \
-            buildTransaction(
-            {
-                'from': account.address,
-                'nonce': nonce,
-                "gasPrice": gas_price,
-            }
-        )
-
-        signed_compound_txn = account.sign_transaction(claim_tx)
-        compound_tx_hash = self.tier_contract.web3.eth.send_raw_transaction(signed_compound_txn.rawTransaction)
-
-        compound_tx_receipt = self.tier_contract.web3.eth.wait_for_transaction_receipt(compound_tx_hash)
+        claim_tx_receipt = send_transaction(self.tier_contract.functions.cashoutAll(node_type), account,
+                                            gas_shape=node_type)
         log.info(" claim_rewards -- completed successful claim of balance with receipt  %s",
-                 compound_tx_receipt)
+                 claim_tx_receipt)
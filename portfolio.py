@@ -0,0 +1,121 @@
+from array import array
+from decimal import Decimal
+
+WEI_PER_ETHER = 10 ** 18
+
+
+def to_wei(amount):
+    """
+        Converts an ether denominated amount (int, float, str or Decimal) to integer wei
+    :param amount:
+    :return:
+    """
+    return int(Decimal(str(amount)) * WEI_PER_ETHER)
+
+
+def from_wei(amount_wei: int):
+    return Decimal(amount_wei) / WEI_PER_ETHER
+
+
+class WalletView:
+    """
+        Lightweight view of one row of a portfolio, it holds no data of its own.
+    """
+    __slots__ = ('portfolio', 'index')
+
+    def __init__(self, portfolio, index: int):
+        self.portfolio = portfolio
+        self.index = index
+
+    @property
+    def name(self):
+        return self.portfolio.names[self.index]
+
+    @property
+    def address(self):
+        return self.portfolio.addresses[self.index]
+
+    @property
+    def balance_wei(self):
+        return self.portfolio.balances_wei[self.index]
+
+    @property
+    def rewards_wei(self):
+        return self.portfolio.rewards_wei[self.index]
+
+    @property
+    def node_count(self):
+        return self.portfolio.node_counts[self.index]
+
+    @property
+    def tier_rewards_wei(self):
+        return {tier: rewards[self.index] for tier, rewards in self.portfolio.tier_rewards_wei.items()}
+
+    def to_investment(self):
+        """
+            The investment dict used by notifications and the per wallet node interface methods
+        :return:
+        """
+        investment = {
+            'name': self.name,
+            'address': self.address,
+            'balance': from_wei(self.balance_wei),
+            'node_count': self.node_count,
+            'rewards': from_wei(self.rewards_wei)}
+        if self.portfolio.tier_rewards_wei:
+            investment['tier_rewards'] = {tier: from_wei(rewards) for tier, rewards in self.tier_rewards_wei.items()}
+        return investment
+
+
+class Portfolio:
+    """
+        Column oriented store of the investments of a wallet fleet.
+
+        Every attribute is a column indexed by the wallet's row. Node counts live in an unsigned array,
+        wei amounts routinely exceed 64 bits so their columns are lists of python ints.
+        Wallets whose investment could not be read have no row, their errors are kept in read_errors.
+    """
+    __slots__ = ('tiers', 'names', 'addresses', 'balances_wei', 'rewards_wei', 'node_counts', 'tier_rewards_wei',
+                 'read_errors', '_index')
+
+    def __init__(self, tiers=()):
+        self.tiers = tuple(tiers)
+        self.names = []
+        self.addresses = []
+        self.balances_wei = []
+        self.rewards_wei = []
+        self.node_counts = array('Q')
+        self.tier_rewards_wei = {tier: [] for tier in self.tiers}
+        self.read_errors = {}
+        self._index = {}
+
+    def add(self, name: str, address: str, balance_wei: int, node_count: int, rewards_wei: int = None,
+            tier_rewards_wei: dict = None):
+        """
+            Appends a wallet row, total rewards default to the sum of the tier rewards
+        :return: the view of the new row
+        """
+        tier_rewards_wei = tier_rewards_wei or {}
+        if rewards_wei is None:
+            rewards_wei = sum(tier_rewards_wei.values())
+
+        self._index[name] = len(self.names)
+        self.names.append(name)
+        self.addresses.append(address)
+        self.balances_wei.append(int(balance_wei))
+        self.rewards_wei.append(int(rewards_wei))
+        self.node_counts.append(int(node_count))
+        for tier, rewards in self.tier_rewards_wei.items():
+            rewards.append(int(tier_rewards_wei.get(tier, 0)))
+
+        return WalletView(self, len(self.names) - 1)
+
+    def get(self, name: str):
+        index = self._index.get(name)
+        return None if index is None else WalletView(self, index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (WalletView(self, index) for index in range(len(self.names)))
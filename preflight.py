@@ -0,0 +1,89 @@
+import logging
+from collections import defaultdict
+
+from tracing import span
+from utility import batch_request, send_transaction
+
+log = logging.getLogger(__name__)
+
+ACTION_COMPOUND = 'compound'
+ACTION_CLAIM = 'claim'
+
+
+class PlannedTransaction:
+    """
+        A contract transaction a cycle intends to send, kept unsigned until it has passed preflight.
+    """
+    __slots__ = ('account', 'contract_function', 'action', 'description', 'gas_shape', 'revert_reason')
+
+    def __init__(self, account, contract_function, action: str, description: str = None, gas_shape=''):
+        self.account = account
+        self.contract_function = contract_function
+        self.action = action
+        self.description = description or contract_function.fn_name
+        self.gas_shape = gas_shape
+        self.revert_reason = None
+
+    @property
+    def will_revert(self):
+        return self.revert_reason is not None
+
+    def to_call(self):
+        return {
+            'from': self.account.address,
+            'to': self.contract_function.address,
+            'data': self.contract_function._encode_transaction_data()}
+
+    def submit(self):
+        """
+            Signs and broadcasts the transaction then waits for its receipt
+        :return: the transaction receipt
+        """
+        return send_transaction(self.contract_function, self.account, gas_shape=self.gas_shape)
+
+    def __repr__(self):
+        return f'<PlannedTransaction {self.description} from {self.account.address}>'
+
+
+def get_revert_reason(response):
+    """
+        Decodes the revert reason of a failed eth_call response
+    :param response:
+    :return:
+    """
+    from web3._utils.method_formatters import raise_solidity_error_on_revert
+
+    try:
+        raise_solidity_error_on_revert(response)
+    except ValueError as e:
+        return str(e)
+    return str(response['error'].get('message', response['error']))
+
+
+def simulate_transactions(planned_transactions: list, block_identifier='latest'):
+    """
+        Simulates every planned transaction with eth_call at the given block, batched into one request
+        per connection. Transactions that would revert get their decoded revert reason set.
+
+        Each transaction is simulated against the same block, later transactions of a wallet do not
+        see the effects of earlier ones.
+
+    :param planned_transactions:
+    :param block_identifier:
+    :return: the planned transactions that will succeed
+    """
+    transactions_by_connection = defaultdict(list)
+    for planned_transaction in planned_transactions:
+        transactions_by_connection[planned_transaction.contract_function.web3].append(planned_transaction)
+
+    for web3_connection, transactions in transactions_by_connection.items():
+        with span('preflight', **{'tx.count': len(transactions)}):
+            responses = batch_request(web3_connection, 'eth_call',
+                                      [[transaction.to_call(), block_identifier] for transaction in transactions])
+
+        for transaction, response in zip(transactions, responses):
+            if 'error' in response:
+                transaction.revert_reason = get_revert_reason(response)
+                log.info(" simulate_transactions -- %s would revert : %s", transaction, transaction.revert_reason)
+
+    return [transaction for transaction in planned_transactions if not transaction.will_revert]
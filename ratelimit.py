@@ -0,0 +1,229 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_RPC_RATE_LIMIT_KEY = 'RPC_RATE_LIMIT'
+ENVIRONMENT_RPC_BURST_KEY = 'RPC_BURST'
+ENVIRONMENT_RPC_MAX_CONCURRENCY_KEY = 'RPC_MAX_CONCURRENCY'
+ENVIRONMENT_RPC_LATENCY_TARGET_KEY = 'RPC_LATENCY_TARGET'
+ENVIRONMENT_RPC_MAX_RETRIES_KEY = 'RPC_MAX_RETRIES'
+
+PRIORITY_METHODS = ('eth_sendRawTransaction',)
+
+# json rpc error codes public nodes use to signal throttling inside a 200 response
+THROTTLE_ERROR_CODES = (-32005, 429)
+
+
+class AdaptiveRateLimiter:
+    """
+        Client side limiter shared by every call made to an rpc endpoint.
+
+        A token bucket caps the request rate while the number of requests in flight is adjusted
+        with additive increase / multiplicative decrease. The limit grows by roughly one request
+        per window of successful fast calls and is cut down on 429s, timeouts or slow responses.
+        Priority requests (transaction sends) skip the concurrency queue and never wait behind reads.
+    """
+
+    def __init__(self, rate=10.0, burst=20, min_concurrency=1, max_concurrency=16, initial_concurrency=4,
+                 latency_target=2.0, decrease_factor=0.5, throttle_cooldown=1.0):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.throttle_cooldown = throttle_cooldown
+
+        self.concurrency_limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.in_flight = 0
+        self.priority_waiting = 0
+
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _wait_time(self, now, priority):
+        """
+            Returns how long a request has to wait before it may start, 0 when it can go right away
+        """
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        if priority:
+            return 0
+
+        if self.priority_waiting or self.in_flight >= int(self.concurrency_limit):
+            # woken up by a release
+            return None
+
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+
+        return 0
+
+    def acquire(self, priority=False):
+        with self._condition:
+            if priority:
+                self.priority_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait_time = self._wait_time(now, priority)
+                    if wait_time == 0:
+                        break
+                    self._condition.wait(wait_time)
+            finally:
+                if priority:
+                    self.priority_waiting -= 1
+
+            # priority requests may borrow against future tokens so bulk reads make way for them
+            self._tokens -= 1
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False, retry_after=None):
+        with self._condition:
+            self.in_flight -= 1
+
+            if throttled:
+                self._decrease()
+                self._tokens = min(self._tokens, 0)
+                self._blocked_until = max(self._blocked_until,
+                                          time.monotonic() + (retry_after or self.throttle_cooldown))
+                log.info(" release -- rpc throttled, concurrency reduced to %s", int(self.concurrency_limit))
+            elif latency is not None and latency > self.latency_target:
+                self._decrease()
+            elif latency is not None:
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+
+            self._condition.notify_all()
+
+    def _decrease(self):
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.decrease_factor)
+
+    @contextlib.contextmanager
+    def limit(self, priority=False):
+        """
+            Holds a request slot for the duration of the block. Latency is reported automatically,
+            callers signal throttling by raising or by calling the yielded `throttled` callback.
+        :param priority:
+        :return:
+        """
+        self.acquire(priority=priority)
+        outcome = {'throttled': False, 'retry_after': None}
+
+        def throttled(retry_after=None):
+            outcome['throttled'] = True
+            outcome['retry_after'] = retry_after
+
+        start_time = time.monotonic()
+        try:
+            yield throttled
+        except Exception as e:
+            if is_throttle_error(e):
+                throttled(get_retry_after(e))
+            raise
+        finally:
+            self.release(latency=time.monotonic() - start_time, throttled=outcome['throttled'],
+                         retry_after=outcome['retry_after'])
+
+    def stats(self):
+        with self._condition:
+            return {
+                'concurrency_limit': int(self.concurrency_limit),
+                'in_flight': self.in_flight,
+                'tokens': round(self._tokens, 2),
+                'rate': self.rate,
+            }
+
+
+def is_throttle_error(error: Exception):
+    """
+        Public nodes signal throttling with http 429 or by timing out under load
+    :param error:
+    :return:
+    """
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+
+    import requests
+
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+def get_retry_after(error: Exception):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle_response(response):
+    error = response.get('error') if isinstance(response, dict) else None
+    return isinstance(error, dict) and error.get('code') in THROTTLE_ERROR_CODES
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+        Returns the process wide limiter, all connections to the rpc endpoint share it
+    :return:
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if not _rate_limiter:
+            _rate_limiter = AdaptiveRateLimiter(
+                rate=float(os.getenv(ENVIRONMENT_RPC_RATE_LIMIT_KEY, 10)),
+                burst=float(os.getenv(ENVIRONMENT_RPC_BURST_KEY, 20)),
+                max_concurrency=int(os.getenv(ENVIRONMENT_RPC_MAX_CONCURRENCY_KEY, 16)),
+                latency_target=float(os.getenv(ENVIRONMENT_RPC_LATENCY_TARGET_KEY, 2.0)))
+        return _rate_limiter
+
+
+def rate_limit_middleware(make_request, web3_connection):
+    """
+        Web3 middleware routing every rpc request through the shared limiter.
+        Throttled reads are retried here with the limiter's backoff instead of failing the whole cycle.
+    :param make_request:
+    :param web3_connection:
+    :return:
+    """
+    rate_limiter = get_rate_limiter()
+    max_retries = int(os.getenv(ENVIRONMENT_RPC_MAX_RETRIES_KEY, 3))
+
+    def middleware(method, params):
+        priority = method in PRIORITY_METHODS
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with rate_limiter.limit(priority=priority) as throttled:
+                    response = make_request(method, params)
+                    if is_throttle_response(response):
+                        throttled()
+            except Exception as e:
+                if priority or attempt > max_retries or not is_throttle_error(e):
+                    raise
+                log.debug(" rate_limit_middleware -- retrying throttled %s attempt %s", method, attempt)
+                continue
+
+            if priority or attempt > max_retries or not is_throttle_response(response):
+                return response
+
+    return middleware
@@ -1,8 +1,13 @@
 import json
 import logging
+import os
+import signal
+import threading
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
-from application import Exponentiator
+from application import ENVIRONMENT_COMPOUND_PCT_KEY, Exponentiator
+from breaker import get_breaker_registry
+from tracing import PROFILE_HEADER, profile_cycle
 from utility import get_service_name
 
 hostName = "0.0.0.0"
@@ -10,31 +15,70 @@ serverPort = 8080
 
 log = logging.getLogger(__name__)
 
-exponentiator = Exponentiator()
+exponentiator = None
+# set by SIGHUP, the reload is applied by the next request instead of inside the signal handler
+reload_requested = threading.Event()
+
+
+def get_exponentiator():
+    """
+        Creates the application on the first request so short lived invocations
+        do not pay for plugin imports before the server starts accepting requests.
+    :return:
+    """
+    global exponentiator
+    if not exponentiator:
+        exponentiator = Exponentiator()
+    return exponentiator
+
+
+def apply_requested_reload():
+    """
+        Reloads the config when SIGHUP was received. Before the first request there is nothing
+        to reload, the config is read when the application is created.
+    :return:
+    """
+    if reload_requested.is_set():
+        reload_requested.clear()
+        if exponentiator:
+            exponentiator.reload_config()
 
 
 class ExponentiatorRequestHandler(BaseHTTPRequestHandler):
 
+    def do_GET(self):
+        if self.path != '/breakers':
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(bytes(json.dumps(get_breaker_registry().snapshot(), indent=2), "utf-8"))
+
     def do_POST(self):
+        apply_requested_reload()
+
         content_len = int(self.headers.get('Content-Length'))
         post_body = self.rfile.read(content_len)
 
         body_json = json.loads(post_body)
-        compound_pct = 100
+        compound_pct = int(os.getenv(ENVIRONMENT_COMPOUND_PCT_KEY, 100))
         if 'compound_pct' in body_json:
             compound_pct = int(body_json['compound_pct'])
 
-        results = exponentiator.execute_check(compound_pct=compound_pct)
+        with profile_cycle(get_service_name(), enabled=self.headers.get(PROFILE_HEADER)):
+            results = get_exponentiator().execute_check(compound_pct=compound_pct)
 
-        withdraw_results = "Not applicable"
-        if self.path == '/withdraw':
+            withdraw_results = "Not applicable"
+            if self.path == '/withdraw':
 
-            if 'withdraw_interval_in_hours' in body_json:
-                withdraw_interval = int(body_json['withdraw_interval_in_hours'])
-                withdraw_results = exponentiator.execute_withdraw(
-                    compound_pct=compound_pct,
-                    interval_in_hours=withdraw_interval
-                )
+                if 'withdraw_interval_in_hours' in body_json:
+                    withdraw_interval = int(body_json['withdraw_interval_in_hours'])
+                    withdraw_results = get_exponentiator().execute_withdraw(
+                        compound_pct=compound_pct,
+                        interval_in_hours=withdraw_interval
+                    )
 
         self.send_response(200)
         self.send_header("Content-type", "text/html")
@@ -56,6 +100,11 @@ class ExponentiatorRequestHandler(BaseHTTPRequestHandler):
 
 if __name__ == "__main__":
 
+    logging.basicConfig(level=logging.INFO)
+
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+
     webServer = HTTPServer((hostName, serverPort), ExponentiatorRequestHandler)
     log.info("Server started http://%s:%s" % (hostName, serverPort))
 
@@ -65,4 +114,6 @@ if __name__ == "__main__":
         pass
 
     webServer.server_close()
+    if exponentiator:
+        exponentiator.clean_up()
     log.info("Server stopped.")
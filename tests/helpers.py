@@ -0,0 +1,10 @@
+class FakeClock:
+    """
+        Clock the tests move forward by hand
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,61 @@
+import unittest
+
+from breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker
+from tests.helpers import FakeClock
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('wallet', failure_threshold=2, reset_timeout=60, max_reset_timeout=600,
+                                      clock=self.clock)
+
+    def open_breaker(self):
+        for _ in range(self.breaker.failure_threshold):
+            self.breaker.record_failure('boom')
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure('boom')
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure('boom')
+        self.assertEqual(STATE_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_without_outcome_keeps_allowing(self):
+        self.open_breaker()
+        self.clock.now += 100
+
+        # callers skipping the wallet or failing before the call must not strand the breaker
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+        self.assertEqual(STATE_HALF_OPEN, self.breaker.state)
+
+    def test_success_closes_a_half_open_breaker(self):
+        self.open_breaker()
+        self.clock.now += 100
+        self.breaker.record_success()
+
+        self.assertEqual(STATE_CLOSED, self.breaker.state)
+        self.assertIsNone(self.breaker.retry_at)
+
+    def test_failure_reopens_a_half_open_breaker_for_longer(self):
+        self.open_breaker()
+        first_timeout = self.breaker.retry_at - self.clock.now
+        self.clock.now += 100
+        self.breaker.record_failure('boom')
+
+        self.assertEqual(STATE_OPEN, self.breaker.state)
+        self.assertGreater(self.breaker.retry_at - self.clock.now, first_timeout)
+
+    def test_failures_while_open_do_not_extend_the_timeout(self):
+        self.open_breaker()
+        retry_at = self.breaker.retry_at
+        self.breaker.record_failure('late failure of a call started before opening')
+
+        self.assertEqual(retry_at, self.breaker.retry_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import itertools
+import unittest
+
+from node.power import PowerNode
+from portfolio import Portfolio, to_wei
+
+
+def can_compound_float(rewards, balance, compound_pct, compounding_cost=75):
+    """
+        The float checks compounding was decided with before amounts moved to integer wei
+    """
+    if compound_pct <= 0 or compound_pct > 100:
+        return False
+
+    true_compounding_cost = (100 / compound_pct * compounding_cost)
+    if rewards >= true_compounding_cost:
+        return True
+
+    if rewards >= compounding_cost / 2:
+        if rewards + balance > true_compounding_cost:
+            if compound_pct == 100:
+                return True
+            if balance > compounding_cost:
+                return True
+
+    return False
+
+
+class CanCompoundManyTest(unittest.TestCase):
+    REWARDS = [0, 1.5, 37, 37.5, 40, 74.99, 75, 90, 100, 149.9, 150, 200, 260, 400, 751, 1000]
+    BALANCES = [0, 10, 36, 74.99, 75, 76, 150, 500]
+    COMPOUND_PCTS = [0, 10, 25, 50, 60, 75, 99, 100, 101]
+
+    def setUp(self):
+        self.node = PowerNode(notifier=None)
+
+    def create_portfolio(self, wallets):
+        portfolio = Portfolio(tiers=self.node.tier_list)
+        for index, (rewards, balance) in enumerate(wallets):
+            portfolio.add(f'wallet{index}', f'0x{index}', balance_wei=to_wei(balance), node_count=1,
+                          tier_rewards_wei={PowerNode.NODE_TYPE_NUCLEAR: to_wei(rewards)})
+        return portfolio
+
+    def test_matches_float_logic(self):
+        wallets = list(itertools.product(self.REWARDS, self.BALANCES))
+        portfolio = self.create_portfolio(wallets)
+
+        for compound_pct in self.COMPOUND_PCTS:
+            with self.subTest(compound_pct=compound_pct):
+                expected = [can_compound_float(rewards, balance, compound_pct) for rewards, balance in wallets]
+                self.assertEqual(expected, self.node.can_compound_many(portfolio, compound_pct=compound_pct))
+
+    def test_balance_tops_up_rewards(self):
+        portfolio = self.create_portfolio([(40, 36), (40, 34), (37, 100), (60, 100), (60, 74)])
+
+        self.assertEqual([True, False, False, True, True], self.node.can_compound_many(portfolio))
+        # below 100% the balance has to cover a whole node on its own
+        self.assertEqual([False, False, False, True, False],
+                         self.node.can_compound_many(portfolio, compound_pct=75))
+
+    def test_matches_can_compound(self):
+        wallets = list(itertools.product(self.REWARDS, self.BALANCES))
+        portfolio = self.create_portfolio(wallets)
+
+        for compound_pct in (50, 100):
+            with self.subTest(compound_pct=compound_pct):
+                self.assertEqual(
+                    [self.node.can_compound(wallet.to_investment(), compound_pct=compound_pct) for wallet in portfolio],
+                    self.node.can_compound_many(portfolio, compound_pct=compound_pct))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from config import ConfigFile, to_environment_value
+
+
+class ConfigFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'config.json')
+        self.config_file = ConfigFile(self.path)
+
+        environment = mock.patch.dict(os.environ, {'SLEEP_DURATION': '300'})
+        environment.start()
+        self.addCleanup(environment.stop)
+        os.environ.pop('COMPOUND_PCT', None)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, values):
+        with open(self.path, 'w') as f:
+            json.dump(values, f)
+        # has_changed compares modification times, make every write count as a change
+        modified_time = (self.config_file.modified_time or 0) + 1
+        os.utime(self.path, ns=(modified_time, modified_time))
+
+    def test_overrides_environment(self):
+        self.write({'SLEEP_DURATION': 60, 'COMPOUND_PCT': '50'})
+
+        self.assertEqual({'SLEEP_DURATION', 'COMPOUND_PCT'}, self.config_file.load())
+        self.assertEqual('60', os.environ['SLEEP_DURATION'])
+        self.assertEqual('50', os.environ['COMPOUND_PCT'])
+
+    def test_only_changed_settings_are_reported(self):
+        self.write({'SLEEP_DURATION': 60, 'COMPOUND_PCT': '50'})
+        self.config_file.load()
+        self.write({'SLEEP_DURATION': 60, 'COMPOUND_PCT': '75'})
+
+        self.assertTrue(self.config_file.has_changed())
+        self.assertEqual({'COMPOUND_PCT'}, self.config_file.load())
+        self.assertFalse(self.config_file.has_changed())
+
+    def test_removed_settings_restore_the_environment(self):
+        self.write({'SLEEP_DURATION': 60, 'COMPOUND_PCT': '50'})
+        self.config_file.load()
+        self.write({'SLEEP_DURATION': 120, 'COMPOUND_PCT': '50'})
+        self.config_file.load()
+        self.write({})
+
+        self.assertEqual({'SLEEP_DURATION', 'COMPOUND_PCT'}, self.config_file.load())
+        # the value from before the file, not the first one the file set
+        self.assertEqual('300', os.environ['SLEEP_DURATION'])
+        self.assertNotIn('COMPOUND_PCT', os.environ)
+
+    def test_settings_added_again_override_once_more(self):
+        self.write({'SLEEP_DURATION': 60})
+        self.config_file.load()
+        self.write({})
+        self.config_file.load()
+        self.write({'SLEEP_DURATION': 90})
+        self.config_file.load()
+        self.write({})
+        self.config_file.load()
+
+        self.assertEqual('300', os.environ['SLEEP_DURATION'])
+
+    def test_rejects_non_object(self):
+        self.write(['SLEEP_DURATION'])
+
+        with self.assertRaises(ValueError):
+            self.config_file.load()
+        self.assertEqual('300', os.environ['SLEEP_DURATION'])
+
+    def test_environment_values(self):
+        self.assertEqual('a,b', to_environment_value(['a', 'b']))
+        self.assertEqual('account1|key1,account2|key2',
+                         to_environment_value({'account1': 'key1', 'account2': 'key2'}))
+        self.assertEqual('60', to_environment_value(60))
+        self.assertEqual('true', to_environment_value(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from coordination.local import LocalLeaseManager, LocalLeaseStore
+from coordination.sqlite import SqliteLeaseManager
+from tests.helpers import FakeClock
+
+WALLETS = [f'0x{index:040x}' for index in range(6)]
+
+
+class LocalLeaseManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = LocalLeaseStore()
+
+    def create_replica(self, replica_id):
+        return LocalLeaseManager(replica_id=replica_id, lease_duration=60, store=self.store, clock=self.clock)
+
+    def test_single_replica_holds_every_wallet(self):
+        self.assertEqual(WALLETS, self.create_replica('a').claim(WALLETS))
+
+    def test_joining_replica_gets_its_share_after_rebalance(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        replica_a.claim(WALLETS)
+
+        # every wallet is still leased to a, b waits until a releases its excess
+        self.assertEqual([], replica_b.claim(WALLETS))
+        held_by_a = replica_a.claim(WALLETS)
+        held_by_b = replica_b.claim(WALLETS)
+
+        self.assertEqual(3, len(held_by_a))
+        self.assertEqual(3, len(held_by_b))
+        self.assertEqual(set(WALLETS), set(held_by_a) | set(held_by_b))
+
+    def test_leases_of_a_dead_replica_expire_and_are_taken_over(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        replica_a.claim(WALLETS)
+        replica_b.claim(WALLETS)
+        replica_a.claim(WALLETS)
+        replica_b.claim(WALLETS)
+
+        # a stops renewing
+        self.clock.now += 30
+        replica_b.claim(WALLETS)
+        self.clock.now += 31
+
+        self.assertEqual(WALLETS, replica_b.claim(WALLETS))
+
+    def test_renew_extends_held_leases(self):
+        replica_a = self.create_replica('a')
+        replica_a.claim(WALLETS)
+
+        self.clock.now += 50
+        self.assertEqual(WALLETS[:2], replica_a.renew(WALLETS[:2]))
+        self.clock.now += 50
+
+        self.assertEqual(WALLETS[:2], replica_a.renew(WALLETS[:2]))
+        self.assertEqual([], replica_a.renew(WALLETS[2:]))
+
+    def test_renew_refuses_wallets_taken_over_during_a_long_cycle(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        replica_a.claim(WALLETS)
+
+        # a's cycle outlasts its leases while b takes over the fleet
+        self.clock.now += 61
+        self.assertEqual(WALLETS, replica_b.claim(WALLETS))
+
+        self.assertEqual([], replica_a.renew(WALLETS))
+
+    def test_release_frees_leases_right_away(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        replica_a.claim(WALLETS)
+        replica_a.release()
+
+        self.assertEqual(WALLETS, replica_b.claim(WALLETS))
+
+
+class SqliteLeaseManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.temp_dir.name, 'leases.sqlite')
+        self.replicas = []
+
+    def tearDown(self):
+        for replica in self.replicas:
+            if replica.connection:
+                replica.connection.close()
+        self.temp_dir.cleanup()
+
+    def create_replica(self, replica_id):
+        replica = SqliteLeaseManager(replica_id=replica_id, lease_duration=60, database=self.database)
+        self.replicas.append(replica)
+        return replica
+
+    def test_replicas_split_the_fleet(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        self.assertEqual(WALLETS, replica_a.claim(WALLETS))
+        self.assertEqual([], replica_b.claim(WALLETS))
+
+        held_by_a = replica_a.claim(WALLETS)
+        held_by_b = replica_b.claim(WALLETS)
+
+        self.assertEqual(3, len(held_by_a))
+        self.assertEqual(3, len(held_by_b))
+        self.assertEqual(set(WALLETS), set(held_by_a) | set(held_by_b))
+
+    def test_concurrent_renewals_share_the_connection(self):
+        replica_a = self.create_replica('a')
+        replica_a.claim(WALLETS)
+
+        renewed, errors = [], []
+
+        def renew(wallets):
+            try:
+                for _ in range(20):
+                    renewed.append(replica_a.renew(wallets))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=renew, args=([wallet],)) for wallet in WALLETS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(20 * len(WALLETS), len(renewed))
+        self.assertTrue(all(len(held_wallets) == 1 for held_wallets in renewed))
+
+    def test_release_frees_leases_right_away(self):
+        replica_a, replica_b = self.create_replica('a'), self.create_replica('b')
+        replica_a.claim(WALLETS)
+        replica_a.release()
+
+        self.assertEqual(WALLETS, replica_b.claim(WALLETS))
+
+
+if __name__ == '__main__':
+    unittest.main()
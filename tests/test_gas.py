@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from gas import GasLimitCache
+
+
+class GasLimitCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.temp_dir.name, 'gas_cache.json')
+        self.key = GasLimitCache.get_key('0xABC', 'compoundTierInto', 'SUPERHUMAN:SUPERHUMAN')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_unknown_shape_is_estimated(self):
+        self.assertIsNone(GasLimitCache().get_gas_limit(self.key))
+
+    def test_learns_highest_gas_used_with_margin(self):
+        gas_limit_cache = GasLimitCache(margin=0.2)
+        gas_limit_cache.learn(self.key, 100000)
+        gas_limit_cache.learn(self.key, 90000)
+
+        self.assertEqual(120000, gas_limit_cache.get_gas_limit(self.key))
+
+        gas_limit_cache.learn(self.key, 110000)
+        self.assertEqual(132000, gas_limit_cache.get_gas_limit(self.key))
+
+    def test_keys_ignore_address_case(self):
+        self.assertEqual(self.key, GasLimitCache.get_key('0xabc', 'compoundTierInto', 'SUPERHUMAN:SUPERHUMAN'))
+
+    def test_invalidate_forgets_shape(self):
+        gas_limit_cache = GasLimitCache(cache_file=self.cache_file)
+        gas_limit_cache.learn(self.key, 100000)
+        gas_limit_cache.invalidate(self.key)
+
+        self.assertIsNone(gas_limit_cache.get_gas_limit(self.key))
+        self.assertIsNone(GasLimitCache(cache_file=self.cache_file).get_gas_limit(self.key))
+
+    def test_persists_across_instances(self):
+        GasLimitCache(cache_file=self.cache_file, margin=0.2).learn(self.key, 100000)
+
+        self.assertEqual(120000, GasLimitCache(cache_file=self.cache_file, margin=0.2).get_gas_limit(self.key))
+        self.assertEqual(['gas_cache.json'], os.listdir(self.temp_dir.name))
+
+    def test_unreadable_file_is_ignored(self):
+        with open(self.cache_file, 'w') as f:
+            f.write('{not json')
+
+        self.assertIsNone(GasLimitCache(cache_file=self.cache_file).get_gas_limit(self.key))
+
+    def test_concurrent_learns_keep_every_shape(self):
+        gas_limit_cache = GasLimitCache(cache_file=self.cache_file)
+        keys = [GasLimitCache.get_key('0xabc', 'swap', str(index)) for index in range(20)]
+        threads = [threading.Thread(target=gas_limit_cache.learn, args=(key, 50000)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reloaded = GasLimitCache(cache_file=self.cache_file, margin=0)
+        self.assertEqual([50000] * len(keys), [reloaded.get_gas_limit(key) for key in keys])
+
+
+if __name__ == '__main__':
+    unittest.main()
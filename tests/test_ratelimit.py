@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from ratelimit import AdaptiveRateLimiter, is_throttle_response
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+
+    def create_limiter(self, **kwargs):
+        limiter_kwargs = dict(rate=1000, burst=1000, max_concurrency=8, initial_concurrency=4, throttle_cooldown=0.01)
+        limiter_kwargs.update(kwargs)
+        return AdaptiveRateLimiter(**limiter_kwargs)
+
+    def test_fast_calls_increase_concurrency(self):
+        rate_limiter = self.create_limiter()
+        for _ in range(20):
+            with rate_limiter.limit():
+                pass
+
+        self.assertGreater(rate_limiter.concurrency_limit, 4)
+        self.assertLessEqual(rate_limiter.concurrency_limit, 8)
+
+    def test_throttled_call_halves_concurrency_and_blocks(self):
+        rate_limiter = self.create_limiter(throttle_cooldown=0.2)
+        with rate_limiter.limit() as throttled:
+            throttled()
+
+        self.assertEqual(2, rate_limiter.concurrency_limit)
+        started = time.monotonic()
+        with rate_limiter.limit():
+            pass
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_slow_call_decreases_concurrency(self):
+        rate_limiter = self.create_limiter(latency_target=0)
+        with rate_limiter.limit():
+            time.sleep(0.01)
+
+        self.assertEqual(2, rate_limiter.concurrency_limit)
+
+    def test_concurrency_never_drops_below_minimum(self):
+        rate_limiter = self.create_limiter()
+        for _ in range(10):
+            with rate_limiter.limit() as throttled:
+                throttled()
+
+        self.assertEqual(1, rate_limiter.concurrency_limit)
+
+    def test_in_flight_calls_are_capped(self):
+        rate_limiter = self.create_limiter(initial_concurrency=2, max_concurrency=2)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with rate_limiter.limit():
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.02)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(2, max(peak))
+        self.assertEqual(0, rate_limiter.in_flight)
+
+    def test_token_bucket_caps_the_rate(self):
+        rate_limiter = self.create_limiter(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            with rate_limiter.limit():
+                pass
+
+        # the burst covers the first call, the other five wait for a token each
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+
+    def test_exceptions_release_the_slot(self):
+        rate_limiter = self.create_limiter()
+        with self.assertRaises(ValueError):
+            with rate_limiter.limit():
+                raise ValueError('boom')
+
+        self.assertEqual(0, rate_limiter.in_flight)
+
+
+class ThrottleResponseTest(unittest.TestCase):
+
+    def test_throttle_codes(self):
+        self.assertTrue(is_throttle_response({'id': 1, 'error': {'code': -32005, 'message': 'limit'}}))
+        self.assertTrue(is_throttle_response({'id': 1, 'error': {'code': 429, 'message': 'limit'}}))
+        self.assertFalse(is_throttle_response({'id': 1, 'error': {'code': 3, 'message': 'execution reverted'}}))
+        self.assertFalse(is_throttle_response({'id': 1, 'result': '0x'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
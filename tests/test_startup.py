@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# plugins pull these in on first use, importing the entry points must not
+HEAVY_MODULES = ('web3', 'eth_account', 'cryptography', 'pycoingecko')
+
+# generous next to the ~0.07s measured so slow machines do not fail it, importing web3 alone takes longer
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', 0.5))
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{'duration': time.perf_counter() - started,
+                  'modules': [name for name in {heavy_modules!r} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module: str):
+    """
+        Imports the module in a fresh interpreter
+    :return: dict with the import duration and the heavy modules it loaded
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)],
+        cwd=REPOSITORY_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_entry_points_do_not_import_plugins(self):
+        for module in ('server', 'main'):
+            with self.subTest(module=module):
+                self.assertEqual([], measure_import(module)['modules'])
+
+    def test_entry_points_import_within_budget(self):
+        for module in ('server', 'main'):
+            with self.subTest(module=module):
+                self.assertLess(measure_import(module)['duration'], IMPORT_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
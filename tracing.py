@@ -0,0 +1,347 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+ENVIRONMENT_PROFILE_KEY = 'PROFILE_CYCLE'
+ENVIRONMENT_PROFILE_MODE_KEY = 'PROFILE_MODE'
+ENVIRONMENT_PROFILE_OUTPUT_DIR_KEY = 'PROFILE_OUTPUT_DIR'
+ENVIRONMENT_PROFILE_SAMPLE_INTERVAL_KEY = 'PROFILE_SAMPLE_INTERVAL'
+ENVIRONMENT_TRACE_EXPORT_FILE_KEY = 'TRACE_EXPORT_FILE'
+ENVIRONMENT_TRACE_COLLECTOR_URL_KEY = 'TRACE_COLLECTOR_URL'
+
+PROFILE_HEADER = 'X-Exponentiator-Profile'
+
+PROFILE_MODE_CPROFILE = 'cprofile'
+PROFILE_MODE_SAMPLING = 'sampling'
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+_current_span = contextvars.ContextVar('exponentiator_current_span', default=None)
+_current_profiler = contextvars.ContextVar('exponentiator_current_profiler', default=None)
+
+
+def is_profiling_enabled(flag=None):
+    """
+        Profiling is opt in, either through the environment for the daemon or
+        through a request header for the server. An explicit flag wins over the environment.
+    :param flag:
+    :return:
+    """
+    if flag is None:
+        flag = os.getenv(ENVIRONMENT_PROFILE_KEY, '')
+    return str(flag).strip().lower() in _TRUE_VALUES
+
+
+class Span:
+
+    def __init__(self, trace, name: str, parent_span_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_time = time.time_ns()
+        self.trace.record(self)
+
+    def to_otlp(self):
+        """
+            Serializes the span using the OTLP/JSON span layout so the output can be
+            fed to any OpenTelemetry collector or viewer.
+        :return:
+        """
+        otlp_span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano': str(self.end_time),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_span_id:
+            otlp_span['parentSpanId'] = self.parent_span_id
+        return otlp_span
+
+
+class Trace:
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, finished_span: Span):
+        with self._lock:
+            self.spans.append(finished_span)
+
+    def to_otlp(self):
+        from utility import get_service_name
+
+        with self._lock:
+            spans = [finished_span.to_otlp() for finished_span in self.spans]
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': get_service_name()}}]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': spans}]}]}
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+        Opens a nested trace span. Outside of a profiled cycle there is no active trace
+        and this is a no-op so the instrumentation costs nothing in normal runs.
+
+    :param name:
+    :param attributes:
+    :return:
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(parent.trace, name, parent_span_id=parent.span_id, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def tracing_middleware(make_request, web3_connection):
+    """
+        Web3 middleware emitting one span per json rpc request
+    :param make_request:
+    :param web3_connection:
+    :return:
+    """
+
+    def middleware(method, params):
+        if _current_span.get() is None:
+            return make_request(method, params)
+
+        with span(f'rpc {method}', **{'rpc.system': 'jsonrpc', 'rpc.method': method}):
+            return make_request(method, params)
+
+    return middleware
+
+
+class CycleProfiler:
+    """
+        cProfile only sees the thread that enabled it. Worker threads of the cycle get a profile
+        of their own which is merged into the stats of the cycle when they are dumped.
+    """
+
+    def __init__(self):
+        self.profiles = [cProfile.Profile()]
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.profiles[0].enable()
+
+    def disable(self):
+        self.profiles[0].disable()
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def dump_stats(self, file_path):
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        stats.dump_stats(file_path)
+
+
+class SamplingProfiler:
+    """
+        Low overhead alternative to cProfile. Periodically samples the stacks of the profiled
+        threads and aggregates them into the folded format understood by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._target_thread_ids = set()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def enable(self):
+        self._target_thread_ids.add(threading.get_ident())
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample, name='exponentiator-sampler', daemon=True)
+        self._sampler.start()
+
+    def disable(self):
+        self._stopped.set()
+        if self._sampler:
+            self._sampler.join()
+
+    @contextlib.contextmanager
+    def profile_thread(self):
+        thread_id = threading.get_ident()
+        self._target_thread_ids.add(thread_id)
+        try:
+            yield
+        finally:
+            self._target_thread_ids.discard(thread_id)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self._target_thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, file_path):
+        with open(file_path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _get_output_dir():
+    output_dir = os.getenv(ENVIRONMENT_PROFILE_OUTPUT_DIR_KEY, 'profiles')
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def export_trace(trace: Trace):
+    """
+        Writes the finished trace as one OTLP/JSON document per line to the export file and
+        optionally posts it to an OTLP/HTTP collector e.g. http://localhost:4318/v1/traces
+    :param trace:
+    :return:
+    """
+    payload = json.dumps(trace.to_otlp())
+
+    export_file = os.getenv(ENVIRONMENT_TRACE_EXPORT_FILE_KEY) or os.path.join(_get_output_dir(), 'traces.jsonl')
+    with open(export_file, 'a') as f:
+        f.write(payload + '\n')
+
+    collector_url = os.getenv(ENVIRONMENT_TRACE_COLLECTOR_URL_KEY)
+    if collector_url:
+        request = urllib.request.Request(collector_url, data=payload.encode(),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+        except Exception:
+            log.warning(" export_trace -- unable to post trace to collector %s", collector_url, exc_info=True)
+
+
+@contextlib.contextmanager
+def profile_thread():
+    """
+        Extends the profile of the cycle to a worker thread, it has to run in a context copied from
+        the cycle e.g. through contextvars.copy_context().run. Outside of a profiled cycle this is a no-op.
+    :return:
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    with profiler.profile_thread():
+        yield
+
+
+@contextlib.contextmanager
+def profile_cycle(cycle_name: str, enabled=None):
+    """
+        Profiles a single cycle and records its trace spans. The profile is dumped as pstats
+        (cprofile mode) or folded stacks (sampling mode) and the trace is exported as OTLP/JSON.
+
+    :param cycle_name:
+    :param enabled:
+    :return:
+    """
+    if not is_profiling_enabled(enabled):
+        yield None
+        return
+
+    if os.getenv(ENVIRONMENT_PROFILE_MODE_KEY, PROFILE_MODE_CPROFILE) == PROFILE_MODE_SAMPLING:
+        profiler = SamplingProfiler(interval=float(os.getenv(ENVIRONMENT_PROFILE_SAMPLE_INTERVAL_KEY, 0.005)))
+        profile_extension = 'folded'
+    else:
+        profiler = CycleProfiler()
+        profile_extension = 'pstats'
+
+    trace = Trace()
+    root_span = Span(trace, 'cycle', attributes={'cycle.name': cycle_name})
+    token = _current_span.set(root_span)
+    profiler_token = _current_profiler.set(profiler)
+    profiler.enable()
+    try:
+        yield root_span
+    except BaseException as e:
+        root_span.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        profiler.disable()
+        _current_profiler.reset(profiler_token)
+        _current_span.reset(token)
+        root_span.end()
+
+        try:
+            profile_file = os.path.join(
+                _get_output_dir(), f'{cycle_name}-{int(time.time() * 1000)}.{profile_extension}')
+            profiler.dump_stats(profile_file)
+            export_trace(trace)
+            log.info(" profile_cycle -- cycle [%s] profile written to %s", cycle_name, profile_file)
+        except Exception:
+            log.warning(" profile_cycle -- unable to write profiling output for [%s]", cycle_name, exc_info=True)
@@ -1,15 +1,31 @@
 import json
 import math
 import os
+import threading
 import time
+from typing import TYPE_CHECKING
 
-import web3
-from cryptography.fernet import Fernet
-from eth_account import Account
+from breaker import circuit_breaker_middleware, endpoint_guard
+from ratelimit import (ENVIRONMENT_RPC_MAX_RETRIES_KEY, get_rate_limiter, is_throttle_error, is_throttle_response,
+                       rate_limit_middleware)
+from tracing import span, tracing_middleware
 
 ENVIRONMENT_SERVICE_NAME_KEY = 'SERVICE_NAME'
 ENVIRONMENT_PRIVATE_KEY_MAP_KEY = 'PRIVATE_KEY_MAP'
 ENVIRONMENT_ENCRYPTION_SECRET = 'ENCRYPTION_SECRET'
+ENVIRONMENT_RPC_BATCH_SIZE_KEY = 'RPC_BATCH_SIZE'
+ENVIRONMENT_RPC_ENDPOINT_KEY = 'RPC_ENDPOINT'
+
+DEFAULT_RPC_ENDPOINT = 'https://rpcapi.fantom.network/'
+
+# connections and decrypted accounts are shared by every plugin in the process
+_network_connections = {}
+_network_connections_lock = threading.Lock()
+_account_cache = {}
+
+if TYPE_CHECKING:
+    import web3
+    from eth_account.signers.local import LocalAccount
 
 
 def get_service_name():
@@ -29,7 +45,7 @@ def load_abi_strings(source_file: str):
     return abi_string
 
 
-def get_contract(web3_connection: web3.Web3, address: str, abi: str):
+def get_contract(web3_connection: 'web3.Web3', address: str, abi: str):
     """
         Given a web3 connection this method creates a contract connection
         for use with the address and abi given to it.
@@ -39,6 +55,8 @@ def get_contract(web3_connection: web3.Web3, address: str, abi: str):
     :param abi:
     :return:
     """
+    import web3
+
     web3_address = web3.Web3.toChecksumAddress(address)
     return web3_connection.eth.contract(address=web3_address, abi=abi)
 
@@ -48,22 +66,36 @@ def get_private_key_map():
         The private keys for your wallet to be used in this program can be specified
         by a comma separated list of addresses prefixed by
         a piped name e.g. account1|private_key1....,account2|private_keyx....
+        Keys are only decrypted the first time they are seen, the keys of wallets no longer configured are dropped.
     :return:
     """
+    from eth_account import Account
+
     wallet_map = {}
     encryption_secret_str = os.getenv(ENVIRONMENT_ENCRYPTION_SECRET)
     wallet_map_str = os.getenv(ENVIRONMENT_PRIVATE_KEY_MAP_KEY)
     if wallet_map_str:
 
+        configured_keys = set()
         wallet_list = wallet_map_str.split(',')
         for wallet_item in wallet_list:
             if '|' not in wallet_item:
-                acc_key = decrypt_key(key=encryption_secret_str, enc_message=wallet_item)
-                wallet_map['default'] = Account.from_key(acc_key)
+                wallet_name, wallet_address = 'default', wallet_item
             else:
                 wallet_name, wallet_address = wallet_item.split('|')
-                acc_key = decrypt_key(key=encryption_secret_str, enc_message=wallet_address)
-                wallet_map[wallet_name] = Account.from_key(acc_key)
+
+            cache_key = (encryption_secret_str, wallet_address)
+            configured_keys.add(cache_key)
+            account = _account_cache.get(cache_key)
+            if account is None:
+                with span('load_account', **{'wallet.name': wallet_name}):
+                    acc_key = decrypt_key(key=encryption_secret_str, enc_message=wallet_address)
+                    account = _account_cache[cache_key] = Account.from_key(acc_key)
+            wallet_map[wallet_name] = account
+
+        # removed wallets and keys encrypted with a replaced secret do not stay decrypted in memory
+        for cache_key in set(_account_cache) - configured_keys:
+            _account_cache.pop(cache_key, None)
 
         return wallet_map
 
@@ -71,15 +103,45 @@ def get_private_key_map():
         ENVIRONMENT_PRIVATE_KEY_MAP_KEY))
 
 
+def get_rpc_endpoint():
+    return os.getenv(ENVIRONMENT_RPC_ENDPOINT_KEY, DEFAULT_RPC_ENDPOINT)
+
+
+def get_shared_connection(endpoint_uri=None):
+    """
+        Returns the process wide connection to an rpc endpoint, creating it on first use.
+        Every node and dex plugin reuses it along with its http session.
+    :param endpoint_uri: defaults to the configured RPC_ENDPOINT
+    :return:
+    """
+    endpoint_uri = endpoint_uri or get_rpc_endpoint()
+    with _network_connections_lock:
+        if endpoint_uri not in _network_connections:
+            import web3
+
+            provider = web3.Web3.HTTPProvider(endpoint_uri)
+            # retries are owned by the shared rate limiter so a throttling endpoint is not hammered
+            provider.middlewares = ()
+
+            web3_connection = web3.Web3(provider)
+            web3_connection.middleware_onion.add(rate_limit_middleware, name='rate_limit')
+            web3_connection.middleware_onion.inject(circuit_breaker_middleware, name='circuit_breaker', layer=0)
+            web3_connection.middleware_onion.add(tracing_middleware, name='tracing')
+            _network_connections[endpoint_uri] = web3_connection
+        return _network_connections[endpoint_uri]
+
+
 def get_network_connection(web3_connection, connection_attempts=5):
     """
-        Obtains a new connection to the fantom network
+        Obtains a connection to the fantom network
     :param web3_connection:
     :param connection_attempts:
     :return:
     """
-    if not web3_connection:
-        web3_connection = web3.Web3(web3.Web3.HTTPProvider('https://rpcapi.fantom.network/'))
+    endpoint_uri = get_rpc_endpoint()
+    if not web3_connection or getattr(web3_connection.provider, 'endpoint_uri', endpoint_uri) != endpoint_uri:
+        # the endpoint was reconfigured, the previous connection stays pooled in case it is switched back
+        web3_connection = get_shared_connection(endpoint_uri)
 
     if web3_connection.isConnected():
         return web3_connection
@@ -91,12 +153,197 @@ def get_network_connection(web3_connection, connection_attempts=5):
     return get_network_connection(web3_connection=web3_connection, connection_attempts=connection_attempts - 1)
 
 
+def batch_request(web3_connection, method: str, params_list: list):
+    """
+        Sends the same json rpc method for every params entry as json rpc batches,
+        one http round trip per RPC_BATCH_SIZE entries instead of one per entry.
+        Providers that can not batch fall back to sequential requests.
+        Calls the endpoint throttles are reported to the rate limiter and retried up to RPC_MAX_RETRIES times.
+
+    :param web3_connection:
+    :param method:
+    :param params_list:
+    :return: raw rpc responses in the order of params_list
+    """
+    from web3 import HTTPProvider
+    from web3._utils.request import make_post_request
+
+    provider = web3_connection.provider
+    if not isinstance(provider, HTTPProvider):
+        return [provider.make_request(method, params) for params in params_list]
+
+    batch_size = int(os.getenv(ENVIRONMENT_RPC_BATCH_SIZE_KEY, 100))
+    max_retries = int(os.getenv(ENVIRONMENT_RPC_MAX_RETRIES_KEY, 3))
+    responses = []
+    for offset in range(0, len(params_list), batch_size):
+        batch_params = params_list[offset:offset + batch_size]
+        batch_responses = [None] * len(batch_params)
+        # entries the endpoint throttled are sent again after the limiter backed off, the others are kept
+        pending_ids = list(range(len(batch_params)))
+
+        for attempt in range(max_retries + 1):
+            payload = [{'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': batch_params[request_id]}
+                       for request_id in pending_ids]
+
+            try:
+                with span(f'rpc batch {method}', **{'rpc.method': method, 'rpc.batch_size': len(payload)}):
+                    with get_rate_limiter().limit() as throttled, endpoint_guard(provider.endpoint_uri):
+                        raw_response = make_post_request(provider.endpoint_uri, json.dumps(payload).encode(),
+                                                         **dict(provider.get_request_kwargs()))
+                        attempt_responses = json.loads(raw_response)
+                        if isinstance(attempt_responses, dict):
+                            if not is_throttle_response(attempt_responses):
+                                # the whole batch was rejected e.g. batching is not supported
+                                raise ValueError(attempt_responses.get('error', attempt_responses))
+                            # the whole batch was rate limited
+                            attempt_responses = [dict(attempt_responses, id=request_id) for request_id in pending_ids]
+
+                        pending_ids = []
+                        for response in attempt_responses:
+                            batch_responses[response['id']] = response
+                            if is_throttle_response(response):
+                                pending_ids.append(response['id'])
+                        if pending_ids:
+                            throttled()
+            except Exception as e:
+                # a 429 or timeout of the whole request leaves every pending entry to retry
+                if attempt == max_retries or not is_throttle_error(e):
+                    raise
+                continue
+
+            if not pending_ids:
+                break
+
+        if pending_ids:
+            # throttling is not the fault of the calls, they must not be mistaken for failed reads
+            raise ValueError(batch_responses[pending_ids[0]]['error'])
+
+        responses.extend(batch_responses)
+    return responses
+
+
+def batch_call(web3_connection, contract_calls: list, block_identifier='latest', raise_errors=True):
+    """
+        Executes read only contract function calls e.g. contract.functions.balanceOf(address)
+        in as few round trips as possible and decodes their outputs like ContractFunction.call does.
+
+    :param web3_connection:
+    :param contract_calls:
+    :param block_identifier:
+    :param raise_errors: when False a failed call's result is the exception it would have raised
+    :return: decoded results in the order of contract_calls
+    """
+    from web3._utils.abi import get_abi_output_types
+    from web3._utils.method_formatters import raise_solidity_error_on_revert
+
+    params_list = [
+        [{'to': contract_call.address, 'data': contract_call._encode_transaction_data()}, block_identifier]
+        for contract_call in contract_calls]
+
+    results = []
+    for contract_call, response in zip(contract_calls, batch_request(web3_connection, 'eth_call', params_list)):
+        if 'error' in response:
+            try:
+                raise_solidity_error_on_revert(response)
+                raise ValueError(response['error'])
+            except ValueError as e:
+                if raise_errors:
+                    raise
+                results.append(e)
+                continue
+
+        output_types = get_abi_output_types(contract_call.abi)
+        decoded = web3_connection.codec.decode_abi(output_types, bytes.fromhex(response['result'][2:]))
+        results.append(decoded[0] if len(decoded) == 1 else decoded)
+    return results
+
+
+def broadcast_transaction(contract_function, account: 'LocalAccount', gas_shape=''):
+    """
+        Builds, signs and broadcasts a contract function transaction from the account without waiting for it.
+        The gas limit comes from the gas limit cache when the transaction shape has been seen before,
+        otherwise it is estimated.
+
+    :param contract_function: e.g. contract.functions.cashoutAll(tier)
+    :param account:
+    :param gas_shape: what drives the gas cost of the call e.g. the tier or swap path
+    :return: the pending transaction to pass to wait_for_transaction
+    """
+    from gas import get_gas_limit_cache
+
+    web3_connection = contract_function.web3
+    nonce = web3_connection.eth.get_transaction_count(account.address)
+    gas_price = web3_connection.eth.gas_price
+
+    gas_key = get_gas_limit_cache().get_key(contract_function.address, contract_function.fn_name, gas_shape)
+    gas_limit = get_gas_limit_cache().get_gas_limit(gas_key)
+
+    transaction_params = {
+        'from': account.address,
+        'nonce': nonce,
+        "gasPrice": gas_price,
+    }
+    if gas_limit:
+        transaction_params['gas'] = gas_limit
+
+    with span('build_transaction', **{'tx.function': contract_function.fn_name, 'tx.gas_cached': bool(gas_limit)}):
+        transaction = contract_function.buildTransaction(transaction_params)
+
+    with span('sign_transaction'):
+        signed_txn = account.sign_transaction(transaction)
+    tx_hash = web3_connection.eth.send_raw_transaction(signed_txn.rawTransaction)
+
+    return {'contract_function': contract_function, 'transaction': transaction, 'tx_hash': tx_hash,
+            'gas_key': gas_key}
+
+
+def wait_for_transaction(pending_transaction: dict):
+    """
+        Waits for a broadcast transaction to be mined and learns its gas usage
+
+    :param pending_transaction:
+    :return: the transaction receipt
+    """
+    from web3.exceptions import ContractLogicError
+
+    from gas import get_gas_limit_cache
+
+    contract_function = pending_transaction['contract_function']
+    tx_hash = pending_transaction['tx_hash']
+
+    with span('wait_for_receipt'):
+        tx_receipt = contract_function.web3.eth.wait_for_transaction_receipt(tx_hash)
+
+    if tx_receipt['status'] == 0:
+        if tx_receipt['gasUsed'] >= pending_transaction['transaction']['gas']:
+            # most likely out of gas, estimate the shape again next time
+            get_gas_limit_cache().invalidate(pending_transaction['gas_key'])
+        raise ContractLogicError(f'transaction {tx_hash.hex()} calling {contract_function.fn_name} reverted')
+
+    get_gas_limit_cache().learn(pending_transaction['gas_key'], tx_receipt['gasUsed'])
+    return tx_receipt
+
+
+def send_transaction(contract_function, account: 'LocalAccount', gas_shape=''):
+    """
+        Builds, signs and broadcasts a contract function transaction from the account
+        then waits for it to be mined.
+
+    :param contract_function: e.g. contract.functions.cashoutAll(tier)
+    :param account:
+    :param gas_shape: what drives the gas cost of the call e.g. the tier or swap path
+    :return: the transaction receipt
+    """
+    return wait_for_transaction(broadcast_transaction(contract_function, account, gas_shape=gas_shape))
+
+
 def decrypt_key(key: str, enc_message: str):
     """
         All account private keys should be secret.
         To encrypt a key use : f = Fernet(key);msg = f.encrypt(message)
     :return:
     """
+    from cryptography.fernet import Fernet
 
     fernet = Fernet(key)
     message_bytes = fernet.decrypt(enc_message.encode())